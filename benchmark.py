@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : benchmark.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+import cv2
+import numpy as np
+
+
+def denoise_benchmark(args):
+    """Time every denoising method and report how far the area and spatial
+    features drift from those of the exact bilateral filter."""
+    import utils
+    from features.core import segment, area_statistics, spatial_statistics
+    from features.denoise import DENOISE_METHODS, denoise
+
+    filter_times = {m: [] for m in DENOISE_METHODS}
+    times = {m: [] for m in DENOISE_METHODS}
+    features = {m: [] for m in DENOISE_METHODS}
+    for image_file in args.images:
+        img = cv2.imread(image_file, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            print('Failed to read the image: {:s}'.format(image_file))
+            continue
+        img = utils.crop_image(img)
+        for method in DENOISE_METHODS:
+            start = time.time()
+            denoise(img, args.d, args.sigma_color, args.sigma_space, method)
+            filter_times[method].append(time.time() - start)
+
+            start = time.time()
+            seg = segment(img, args.d, args.sigma_color, args.sigma_space,
+                          clustering=args.clustering, denoise=method)
+            f = np.hstack((area_statistics(seg), spatial_statistics(seg)))
+            times[method].append(time.time() - start)
+            features[method].append(f)
+    if len(times['bilateral']) == 0:
+        return
+
+    ref = np.array(features['bilateral'])
+    print('Mean time per image over {:d} images, and mean feature drift from '
+          'the bilateral filter'.format(len(ref)))
+    print('{:<12s}{:>11s}{:>9s}{:>10s}{:>9s}{:>11s}{:>13s}{:>13s}'.format(
+        'method', 'filter (s)', 'speedup', 'segm. (s)', 'speedup',
+        'area (pp)', 'spatial med', 'spatial max'))
+    for method in DENOISE_METHODS:
+        f = np.array(features[method])
+        tf = np.mean(filter_times[method])
+        t = np.mean(times[method])
+        # Area fractions drift in percentage points, the spatial statistics
+        # relative to their value with the bilateral filter.
+        area = 100 * np.abs(f[:, :3] - ref[:, :3]).max(axis=1).mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rel = np.abs(f[:, 3:] - ref[:, 3:]) / np.abs(ref[:, 3:])
+        rel = 100 * rel[np.isfinite(rel)]
+        print('{:<12s}{:>11.3f}{:>8.1f}x{:>10.3f}{:>8.1f}x{:>11.2f}{:>12.1f}%'
+              '{:>12.1f}%'.format(
+                  method, tf, np.mean(filter_times['bilateral']) / tf, t,
+                  np.mean(times['bilateral']) / t, area,
+                  np.median(rel) if len(rel) > 0 else 0,
+                  rel.max() if len(rel) > 0 else 0))
+
+
+def haralick_benchmark(args):
+    """Time features.texture against mahotas on the images turned to RGB,
+    as the Haralick features were computed before, and report the largest
+    relative difference."""
+    import mahotas.features
+    import utils
+    from features.texture import haralick, haralick_batch
+
+    images = []
+    for image_file in args.images:
+        img = cv2.imread(image_file, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            print('Failed to read the image: {:s}'.format(image_file))
+            continue
+        images.append(utils.crop_image(img))
+    if len(images) == 0:
+        return
+
+    start = time.time()
+    ref = np.array([mahotas.features.haralick(
+        cv2.cvtColor(img, cv2.COLOR_GRAY2RGB), distance=args.distance,
+        return_mean=True, ignore_zeros=False) for img in images])
+    t_mahotas = time.time() - start
+    start = time.time()
+    f = np.array([haralick(img, args.distance) for img in images])
+    t_texture = time.time() - start
+    start = time.time()
+    haralick_batch(images, args.distance)
+    t_batch = time.time() - start
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel = np.abs(f - ref) / np.abs(ref)
+    rel = rel[np.isfinite(rel)]
+
+    print('Mean time per image over {:d} images'.format(len(images)))
+    print('{:<18s}{:>10s}{:>9s}'.format('backend', 'time (s)', 'speedup'))
+    for name, t in [('mahotas', t_mahotas), ('texture', t_texture),
+                    ('texture, batch', t_batch)]:
+        print('{:<18s}{:>10.3f}{:>8.1f}x'.format(name, t / len(images),
+                                               t_mahotas / t))
+    if args.levels is not None:
+        start = time.time()
+        haralick_batch(images, args.distance, levels=args.levels)
+        t = time.time() - start
+        print('{:<18s}{:>10.3f}{:>8.1f}x'.format(
+            'levels={:d}'.format(args.levels), t / len(images),
+            t_mahotas / t))
+    print('Largest relative difference from mahotas: {:.1e}'.format(
+        rel.max() if len(rel) > 0 else 0))
+
+
+def lbp_benchmark(args):
+    """Time features.texture against skimage for the LBP histograms of every
+    (P, R) scale, one scale at a time and all scales in one pass."""
+    from skimage.feature import local_binary_pattern
+    import utils
+    from features.texture import lbp, lbp_histograms
+
+    scales = [tuple(s) for s in args.scale] if args.scale else [(10, 5)]
+    scales = [(int(P), R) for P, R in scales]
+    t_skimage = t_texture = t_fused = 0
+    diff = 0
+    n_images = 0
+    for image_file in args.images:
+        img = cv2.imread(image_file, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            print('Failed to read the image: {:s}'.format(image_file))
+            continue
+        img = utils.crop_image(img)
+        n_images += 1
+        for P, R in scales:
+            start = time.time()
+            ref, _ = np.histogram(local_binary_pattern(img, P, R),
+                                  bins=P + 2, range=(0, P + 2), density=True)
+            t_skimage += time.time() - start
+            start = time.time()
+            h = lbp(img, P, R)
+            t_texture += time.time() - start
+            diff = max(diff, np.abs(h - ref).max())
+        start = time.time()
+        lbp_histograms(img, scales)
+        t_fused += time.time() - start
+    if n_images == 0:
+        return
+
+    print('Mean time per image over {:d} images, scales {:s}'.format(
+        n_images, ' '.join('({:d}, {:g})'.format(P, R) for P, R in scales)))
+    print('{:<22s}{:>10s}{:>9s}'.format('backend', 'time (s)', 'speedup'))
+    for name, t in [('skimage', t_skimage), ('texture', t_texture),
+                    ('texture, one pass', t_fused)]:
+        print('{:<22s}{:>10.3f}{:>8.1f}x'.format(name, t / n_images,
+                                               t_skimage / t))
+    print('Largest difference from skimage: {:.1e}'.format(diff))
+
+
+# Modules timed by the imports benchmark, and the libraries they should only
+# load when a plotting or table function runs.
+IMPORT_MODULES = ['features.core', 'features', 'utils', 'features.sweep',
+                  'segment_image']
+LAZY_MODULES = ['pandas', 'matplotlib', 'seaborn', 'scipy', 'sklearn']
+
+
+def import_benchmark(args):
+    """Time importing each module in a fresh interpreter, as a command line
+    tool or a spawned worker process does, and list the libraries of
+    LAZY_MODULES the import loads. With --check, exit with status 1 if one
+    of them is loaded or an import takes longer than --max-time."""
+    code = ('import sys, time\n'
+            't = time.perf_counter()\n'
+            'import {:s}\n'
+            'print(time.perf_counter() - t)\n'
+            'print(" ".join(m for m in {!r} if m in sys.modules))')
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    failed = False
+    print('{:<20s}{:>10s}{:>10s}  {:s}'.format('Module', 'Best (s)',
+                                               'Median', 'Lazy modules'))
+    for module in args.modules:
+        times = []
+        for _ in range(args.repeat):
+            out = subprocess.run([sys.executable, '-c',
+                                  code.format(module, LAZY_MODULES)],
+                                 cwd=cwd, check=True, stdout=subprocess.PIPE,
+                                 universal_newlines=True).stdout.split('\n')
+            times.append(float(out[0]))
+        loaded = out[1].split()
+        print('{:<20s}{:>10.3f}{:>10.3f}  {:s}'.format(
+            module, min(times), np.median(times),
+            ', '.join(loaded) if len(loaded) > 0 else '-'))
+        if len(loaded) > 0 or \
+                (args.max_time is not None and min(times) > args.max_time):
+            failed = True
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmarks.')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    denoise_parser = subparsers.add_parser(
+        'denoise', help='speed and feature drift of the denoising methods')
+    denoise_parser.add_argument('images', type=str, nargs='+',
+                                help='image files')
+    denoise_parser.add_argument('--d', type=int, default=15)
+    denoise_parser.add_argument('--sigma-color', type=float, default=75)
+    denoise_parser.add_argument('--sigma-space', type=float, default=75)
+    denoise_parser.add_argument('--clustering', type=str, default='histogram')
+    denoise_parser.set_defaults(func=denoise_benchmark)
+
+    haralick_parser = subparsers.add_parser(
+        'haralick', help='speed of the Haralick features against mahotas')
+    haralick_parser.add_argument('images', type=str, nargs='+',
+                                 help='image files')
+    haralick_parser.add_argument('--distance', type=int, default=1)
+    haralick_parser.add_argument('--levels', type=int, default=None,
+                                 help='also time reduced gray levels')
+    haralick_parser.set_defaults(func=haralick_benchmark)
+
+    lbp_parser = subparsers.add_parser(
+        'lbp', help='speed of the LBP histograms against skimage')
+    lbp_parser.add_argument('images', type=str, nargs='+',
+                            help='image files')
+    lbp_parser.add_argument('--scale', type=float, nargs=2, action='append',
+                            metavar=('P', 'R'),
+                            help='(P, R) scale, can be repeated')
+    lbp_parser.set_defaults(func=lbp_benchmark)
+
+    import_parser = subparsers.add_parser(
+        'imports', help='import time of the modules in a fresh interpreter')
+    import_parser.add_argument('modules', type=str, nargs='*',
+                               default=IMPORT_MODULES,
+                               help='modules to import')
+    import_parser.add_argument('--repeat', type=int, default=5)
+    import_parser.add_argument('--max-time', type=float, default=None,
+                               help='import time limit in seconds for --check')
+    import_parser.add_argument('--check', action='store_true',
+                               help='fail if a module loads a lazy module or '
+                                    'is slower than --max-time')
+    import_parser.set_defaults(func=import_benchmark)
+
+    args = parser.parse_args()
+    args.func(args)
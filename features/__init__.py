@@ -1,13 +1,11 @@
-import numpy as np
-import pandas as pd
-
-import cv2
-
 from features.features import *
+from features.cache import FeatureCache
+from features.table import update_feature_table
 
 FEATURE_NAMES = [
     'area',
     'spatial',
+    'morphology',
     'haralick',
     'lbp'
 ]
@@ -17,56 +15,53 @@ def collect_features_by_filenames(filenames, feature_names, **kwargs):
     for fn in feature_names:
         if fn not in FEATURE_NAMES:
             raise Exception('Unknown feature name: {:s}'.format(fn))
-    feature = []
 
     d = kwargs['d'] if 'd' in kwargs else 15
-    sigma_color = kwargs['sigma_color'] if 'area_sigma_color' in kwargs else 75
-    sigma_space = kwargs['sigma_space'] if 'area_sigma_space' in kwargs else 75
+    sigma_color = kwargs['sigma_color'] if 'sigma_color' in kwargs else 75
+    sigma_space = kwargs['sigma_space'] if 'sigma_space' in kwargs else 75
     with_info_bar = kwargs['with_info_bar'] if 'with_info_bar' in kwargs else True
     distance = kwargs['distance'] if 'distance' in kwargs else 1
     P = kwargs['P'] if 'P' in kwargs else 10
     R = kwargs['R'] if 'R' in kwargs else 5
+    clustering = kwargs['clustering'] if 'clustering' in kwargs else 'histogram'
+    denoise = kwargs['denoise'] if 'denoise' in kwargs else 'bilateral'
+    level = kwargs['level'] if 'level' in kwargs else 0
+    ksize0 = kwargs['ksize0'] if 'ksize0' in kwargs else 9
+    ksize1 = kwargs['ksize1'] if 'ksize1' in kwargs else 9
+    ksize2 = kwargs['ksize2'] if 'ksize2' in kwargs else 9
+    ksize3 = kwargs['ksize3'] if 'ksize3' in kwargs else 3
+    tile_size = kwargs['tile_size'] if 'tile_size' in kwargs else None
 
-    if 'area' in feature_names:
-        f = area_features(image_names=filenames,
-                          d=d,
-                          sigma_color=sigma_color,
-                          sigma_space=sigma_space,
-                          with_info_bar=with_info_bar)
-        if len(feature) == 0:
-            feature = f
-        else:
-            feature = np.hstack((feature, f))
-
-    if 'spatial' in feature_names:
-        f = spatial_features(image_names=filenames,
-                             d=d,
-                             sigma_color=sigma_color,
-                             sigma_space=sigma_space,
-                             with_info_bar=with_info_bar)
-        if len(feature) == 0:
-            feature = f
-        else:
-            feature = np.hstack((feature, f))
-
-    if 'haralick' in feature_names:
-        f = haralick_features(image_names=filenames,
-                              distance=distance)
-        if len(feature) == 0:
-            feature = f
-        else:
-            feature = np.vstack((feature, f))
-
-    if 'lbp' in feature_names:
-        f = lbp_features(image_names=filenames,
-                         P=P,
-                         R=R)
-        if len(feature) == 0:
-            feature = f
-        else:
-            feature = np.vstack((feature, f))
+    n_workers = kwargs['n_workers'] if 'n_workers' in kwargs else 1
+    executor = kwargs['executor'] if 'executor' in kwargs else None
+    chunksize = kwargs['chunksize'] if 'chunksize' in kwargs else None
+    errors = kwargs['errors'] if 'errors' in kwargs else None
+    cache = kwargs['cache'] if 'cache' in kwargs else None
+    if isinstance(cache, str):
+        cache = FeatureCache(cache)
 
-    return feature
+    # Each image is decoded and segmented once for all feature families.
+    return collect_image_features(filenames, feature_names,
+                                  n_workers=n_workers,
+                                  executor=executor,
+                                  chunksize=chunksize,
+                                  errors=errors,
+                                  d=d,
+                                  sigma_color=sigma_color,
+                                  sigma_space=sigma_space,
+                                  with_info_bar=with_info_bar,
+                                  distance=distance,
+                                  P=P,
+                                  R=R,
+                                  clustering=clustering,
+                                  denoise=denoise,
+                                  level=level,
+                                  ksize0=ksize0,
+                                  ksize1=ksize1,
+                                  ksize2=ksize2,
+                                  ksize3=ksize3,
+                                  tile_size=tile_size,
+                                  cache=cache)
 
 
 if __name__ == '__main__':
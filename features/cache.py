@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : cache.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+
+# Bump when a change to the feature code changes feature values, so that
+# entries computed by older code are not used.
+CACHE_VERSION = 2
+
+# Parameters that a feature family depends on. Parameters not listed do not
+# invalidate the cached features of that family.
+CACHE_PARAMS = {
+    'area': ['with_info_bar', 'd', 'sigma_color', 'sigma_space',
+             'ksize0', 'ksize1', 'ksize2', 'ksize3', 'clustering',
+             'denoise', 'level'],
+    'spatial': ['with_info_bar', 'd', 'sigma_color', 'sigma_space',
+                'ksize0', 'ksize1', 'ksize2', 'ksize3', 'clustering',
+                'denoise', 'level'],
+    'morphology': ['with_info_bar', 'd', 'sigma_color', 'sigma_space',
+                   'ksize0', 'ksize1', 'ksize2', 'ksize3', 'clustering',
+                   'denoise', 'level'],
+    'haralick': ['with_info_bar', 'distance'],
+    'lbp': ['with_info_bar', 'P', 'R']
+}
+
+# A FeatureCache rescans its directory whenever it has written this fraction
+# of max_size since its last scan, see FeatureCache.
+RESCAN_FRACTION = 1 / 64
+
+
+def file_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def digest_file(filename):
+    """file_digest of the content of a file, read a block at a time."""
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FeatureCache(object):
+    """Features on disk, keyed by image content and parameters.
+
+    Every entry is the feature vector of one feature family of one image,
+    stored as a .npy file under directory. When the entries take more than
+    max_size bytes, the least recently used ones are removed. The object is
+    picklable and can be shared with worker processes.
+
+    Every process only counts the bytes it writes itself, so the size of the
+    directory is rescanned whenever a process has written RESCAN_FRACTION of
+    max_size since its last scan; the entries of other processes are then
+    counted as well. With n processes sharing a directory, it grows to at
+    most about (1 + n * RESCAN_FRACTION) * max_size.
+
+    Callers that compute a feature family differently (the GUI reads color
+    images, for one) pass their own variant to key, so that they never read
+    each other's entries.
+    """
+
+    def __init__(self, directory, max_size=1 << 30):
+        self.directory = directory
+        self.max_size = max_size
+        # Size of the directory at the last scan, and bytes written by this
+        # process since.
+        self.size = None
+        self.written = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, digest, feature_name, params, variant='features'):
+        values = [[p, params[p]] for p in CACHE_PARAMS[feature_name]]
+        s = json.dumps([CACHE_VERSION, variant, digest, feature_name,
+                        values])
+        return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.npy')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            value = np.load(path)
+            # The modification time records the last use.
+            os.utime(path, None)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def put(self, key, value):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+
+        # Write to a temporary file first so that readers in other processes
+        # never see a partial entry.
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.asarray(value))
+        os.replace(tmp, path)
+
+        self.written += os.path.getsize(path) - old_size
+        if self.size is None or \
+                self.written >= self.max_size * RESCAN_FRACTION:
+            self.scan()
+        if self.size + self.written > self.max_size:
+            self.evict()
+
+    def scan(self):
+        self.size = sum(e[2] for e in self.entries())
+        self.written = 0
+
+    def entries(self):
+        """(path, last use, size) of every entry."""
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for e in os.scandir(shard.path):
+                if e.name.endswith('.npy'):
+                    st = e.stat()
+                    entries.append((e.path, st.st_mtime, st.st_size))
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        self.size = sum(e[2] for e in entries)
+        self.written = 0
+        for path, _, size in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.size -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            os.remove(path)
+        self.size = 0
+        self.written = 0
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : core.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from features.denoise import denoise as denoise_image
+
+CLUSTERING_METHODS = ['histogram', 'kmeans']
+
+# Colors of the matrix, p2 and p3 in segmentation images, as BGR.
+COLORS = [(219, 94, 86),
+          (86, 219, 127),
+          (86, 111, 219)]
+
+# Connected components of one phase image, as returned by
+# cv2.connectedComponentsWithStats; label 0 is the background.
+Components = namedtuple('Components', ['n_labels', 'labels', 'stats',
+                                       'centroids'])
+
+# Result of segment(): the filtered image, the threshold between the two
+# intensity clusters, the phase images p2 and p3, and the connected
+# components of both phases (None if they were not computed).
+Segmentation = namedtuple('Segmentation', ['filtered', 'threshold', 'p2',
+                                           'p3', 'components2',
+                                           'components3'])
+
+
+def histogram_threshold(img):
+    """Exact 2-means clustering of an 8-bit image from its histogram.
+
+    In one dimension the two k-means clusters are split by a threshold, and
+    minimizing the within-cluster sum of squares is the same as maximizing
+    w0 * w1 * (mu0 - mu1)^2 over the 255 possible thresholds, which only
+    needs the 256-bin histogram. Returns t such that pixels <= t form the
+    darker cluster.
+    """
+    return threshold_from_histogram(np.bincount(img.ravel(), minlength=256))
+
+
+def threshold_from_histogram(h):
+    """histogram_threshold of an image with the 256-bin histogram h."""
+    h = np.asarray(h, dtype=np.float64)
+    w0 = np.cumsum(h)
+    s0 = np.cumsum(h * np.arange(256))
+    w1 = w0[-1] - w0
+    s1 = s0[-1] - s0
+    # w0 * w1 * (mu0 - mu1)^2 = (s0 * w1 - s1 * w0)^2 / (w0 * w1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (s0 * w1 - s1 * w0) ** 2 / (w0 * w1)
+    between[~np.isfinite(between)] = 0
+    return int(np.argmax(between[:255]))
+
+
+def kmeans_threshold(img):
+    """2-means clustering of every pixel with cv2.kmeans.
+
+    Returns t such that pixels <= t form the darker cluster. This is the
+    original approach; it is much slower than histogram_threshold, and as it
+    stops once the centers move by less than one grey level, t can be a
+    level away from the optimum.
+    """
+    Z = img.astype(np.float32).reshape((-1, 1))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1.0)
+    ret, label, center = cv2.kmeans(Z, 2, None, criteria, 10,
+                                    cv2.KMEANS_PP_CENTERS)
+    dark = label.ravel() == np.argmin(center.ravel())
+    if not dark.any():
+        return -1
+    return int(Z[dark].max())
+
+
+def two_means_threshold(img, clustering='histogram'):
+    """Threshold splitting an 8-bit grayscale image into a dark and a bright
+    intensity cluster, by clustering='histogram' or 'kmeans'."""
+    if clustering == 'histogram':
+        return histogram_threshold(img)
+    elif clustering == 'kmeans':
+        return kmeans_threshold(img)
+    else:
+        raise ValueError('Unknown clustering method: {:s}'.format(clustering))
+
+
+class Workspace(object):
+    """Scratch buffers reused from one image to the next.
+
+    Buffers are reallocated only when the image size changes. Arrays
+    returned by functions given a workspace are only valid until the
+    workspace is used again.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype)
+            self.buffers[name] = buf
+        return buf
+
+
+_kernels = {}
+
+
+def kernel(ksize):
+    """ksize x ksize structuring element for opening and closing."""
+    if ksize not in _kernels:
+        _kernels[ksize] = np.ones((ksize, ksize), np.uint8)
+    return _kernels[ksize]
+
+
+def phase_masks(img, t, ksize0=9, ksize1=9, ksize2=9, ksize3=3,
+                workspace=None):
+    """Phase images of a filtered 8-bit image split into two clusters at t.
+
+    p3 is the dark cluster after closing (ksize0) then opening (ksize1); p2
+    is the dark cluster after opening (ksize2) then closing (ksize3), minus
+    p3. Pixels belonging to a phase are 0, all others are 255. Every step
+    writes into uint8 buffers of the workspace, if one is given.
+    """
+    ws = workspace if workspace is not None else Workspace()
+    bright = ws.get('bright', img.shape)
+    p2 = ws.get('p2', img.shape)
+    p3 = ws.get('p3', img.shape)
+
+    cv2.threshold(img, t, 255, cv2.THRESH_BINARY, dst=bright)
+
+    # Apply closing then opening.
+    cv2.morphologyEx(bright, cv2.MORPH_CLOSE, kernel(ksize0), dst=p3)
+    cv2.morphologyEx(p3, cv2.MORPH_OPEN, kernel(ksize1), dst=p3)
+
+    # Apply opening then closing, and remove p3.
+    cv2.morphologyEx(bright, cv2.MORPH_OPEN, kernel(ksize2), dst=p2)
+    cv2.morphologyEx(p2, cv2.MORPH_CLOSE, kernel(ksize3), dst=p2)
+    cv2.bitwise_not(p3, dst=bright)
+    cv2.bitwise_or(p2, bright, dst=p2)
+
+    return p2, p3
+
+
+def phase_fraction(p):
+    """Fraction of the pixels of a phase image that belong to the phase."""
+    return (p.size - cv2.countNonZero(p)) / p.size
+
+
+def connected_components(p, name='p', workspace=None):
+    """8-connected components of the pixels of a phase image that belong to
+    the phase."""
+    ws = workspace if workspace is not None else Workspace()
+    inv = cv2.bitwise_not(p, dst=ws.get(name + '_inv', p.shape))
+    labels = ws.get(name + '_labels', p.shape, np.int32)
+    return Components(*cv2.connectedComponentsWithStats(
+        inv, labels, connectivity=8, ltype=cv2.CV_32S))
+
+
+def scaled_ksize(ksize, factor):
+    """Odd kernel size covering about the same area as ksize on an image
+    shrunk by factor."""
+    return max(1, 2 * int(np.floor((ksize / factor - 1) / 2 + 0.5)) + 1)
+
+
+def pyramid(img, level=0):
+    """img shrunk level times by half with cv2.pyrDown."""
+    for _ in range(level):
+        img = cv2.pyrDown(img)
+    return img
+
+
+def level_params(level, d, sigma_space, ksize0, ksize1, ksize2, ksize3):
+    """d, sigma_space and the kernel sizes scaled to pyramid level."""
+    if level == 0:
+        return d, sigma_space, ksize0, ksize1, ksize2, ksize3
+    factor = 2 ** level
+    return (max(1, d // factor), sigma_space / factor) + tuple(
+        scaled_ksize(k, factor) for k in [ksize0, ksize1, ksize2, ksize3])
+
+
+def upsample_masks(p2, p3, shape, workspace=None):
+    """Phase images of size shape from phase images computed on a shrunk
+    image, upsampled by nearest neighbor."""
+    ws = workspace if workspace is not None else Workspace()
+    size = (shape[1], shape[0])
+    P2 = cv2.resize(p2, size, dst=ws.get('p2_full', shape),
+                    interpolation=cv2.INTER_NEAREST)
+    P3 = cv2.resize(p3, size, dst=ws.get('p3_full', shape),
+                    interpolation=cv2.INTER_NEAREST)
+    return P2, P3
+
+
+def segment(img, d=15, sigma_color=75, sigma_space=75, ksize0=9, ksize1=9,
+            ksize2=9, ksize3=3, clustering='histogram', denoise='bilateral',
+            level=0, components=True, workspace=None):
+    """Segment an 8-bit grayscale image into the matrix and two phases.
+
+    Bilateral filter, or the faster approximation selected by denoise (see
+    features.denoise), 2-means clustering of the intensities (see
+    two_means_threshold), then closing and opening (see phase_masks). With
+    components=True the connected components of both phases are labelled as
+    well. This is the segmentation behind every area and spatial feature and
+    every segmentation image, in the command line tools and the GUI alike.
+
+    With level > 0 the image is first shrunk level times by half with
+    cv2.pyrDown, which processes 4^level times fewer pixels; d, sigma_space
+    and the kernel sizes are scaled to match, and the phase images are
+    upsampled back to the size of img (see upsample_masks). The filtered
+    image is then the one at the reduced size.
+    """
+    ws = workspace if workspace is not None else Workspace()
+    small = pyramid(img, level)
+    d, sigma_space, ksize0, ksize1, ksize2, ksize3 = level_params(
+        level, d, sigma_space, ksize0, ksize1, ksize2, ksize3)
+
+    filtered = ws.get('filtered', small.shape)
+    denoise_image(small, d, sigma_color, sigma_space, denoise, dst=filtered)
+
+    t = two_means_threshold(filtered, clustering)
+    p2, p3 = phase_masks(filtered, t, ksize0, ksize1, ksize2, ksize3,
+                         workspace=ws)
+    if level > 0:
+        p2, p3 = upsample_masks(p2, p3, img.shape, ws)
+    components2 = components3 = None
+    if components:
+        components2 = connected_components(p2, 'p2', ws)
+        components3 = connected_components(p3, 'p3', ws)
+    return Segmentation(filtered, t, p2, p3, components2, components3)
+
+
+def area_statistics(seg):
+    """Area fractions of the matrix, p2 and p3."""
+    p2_feature = phase_fraction(seg.p2)
+    p3_feature = phase_fraction(seg.p3)
+    return np.asarray([1 - p2_feature - p3_feature, p2_feature, p3_feature])
+
+
+def region_statistics(components):
+    stats = components.stats[1:]
+    centroids = components.centroids[1:]
+    return shape_statistics(stats[:, 4], stats[:, 2], stats[:, 3],
+                            centroids[:, 0], centroids[:, 1])
+
+
+def shape_statistics(area, width, height, x, y):
+    """The 7 spatial features of the regions of one phase, given the area,
+    the bounding box size and the centroid of every region: the number of
+    regions, then the mean and std of the areas, the std of the x and y
+    centroids and the mean and std of width * height / area.
+
+    The four per-region quantities are stacked as the rows of one array,
+    so the means and stds are one reduction each.
+    """
+    v = np.empty((4, len(area)))
+    v[0] = area
+    v[1] = x
+    v[2] = y
+    np.multiply(width, height, out=v[3])
+    v[3] /= v[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = v.mean(axis=1)
+        std = v.std(axis=1)
+    return [len(area), mean[0], std[0], std[1], std[2], mean[3], std[3]]
+
+
+def spatial_statistics(seg):
+    """The 7 region statistics of p2 followed by those of p3; seg must have
+    been computed with components=True."""
+    return region_statistics(seg.components2) + \
+        region_statistics(seg.components3)
+
+
+def perimeters(components):
+    """Perimeter of every region in pixel edges: the number of sides of its
+    pixels shared with pixels outside of it or with the image border."""
+    labels = components.labels
+    counts = np.zeros(components.n_labels, np.int64)
+    # 4-adjacent pixels of different labels are a region and the background,
+    # since 8-connected regions cannot touch each other.
+    for a, b in [(labels[:, :-1], labels[:, 1:]), (labels[:-1], labels[1:])]:
+        edge = a != b
+        counts += np.bincount(a[edge], minlength=components.n_labels)
+        counts += np.bincount(b[edge], minlength=components.n_labels)
+    for border in [labels[0], labels[-1], labels[:, 0], labels[:, -1]]:
+        counts += np.bincount(border, minlength=components.n_labels)
+    return counts[1:]
+
+
+def nearest_neighbor_distances(x, y):
+    """Distance from every point to the nearest other point."""
+    from scipy.spatial import cKDTree
+    if len(x) < 2:
+        return np.zeros(0)
+    points = np.column_stack((x, y))
+    distances, _ = cKDTree(points).query(points, k=2)
+    return distances[:, 1]
+
+
+def morphology_statistics(seg):
+    """The 6 morphology features of p2 followed by those of p3: mean and std
+    of the region perimeters (see perimeters), of the equivalent diameters
+    sqrt(4 * area / pi) and of the distances between the centroids of
+    nearest regions. seg must have been computed with components=True, and
+    its label images must still be valid (see Workspace)."""
+    features = []
+    for components in [seg.components2, seg.components3]:
+        area = components.stats[1:, 4]
+        centroids = components.centroids[1:]
+        v = [perimeters(components), np.sqrt(4 * area / np.pi),
+             nearest_neighbor_distances(centroids[:, 0], centroids[:, 1])]
+        for values in v:
+            features += [np.mean(values), np.std(values)] \
+                if len(values) > 0 else [np.nan, np.nan]
+    return features
+
+
+def segmentation_image(seg, dtype=np.uint8):
+    """Segmentation image with the matrix, p2 and p3 in COLORS."""
+    seg_img = np.empty(seg.p2.shape + (3,), dtype=dtype)
+    seg_img[:] = COLORS[0]
+    seg_img[seg.p2 != 255] = COLORS[1]
+    seg_img[seg.p3 != 255] = COLORS[2]
+    return seg_img
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : denoise.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import cv2
+import numpy as np
+
+# Edge-preserving filters applied before segmentation, from exact and
+# slowest to approximate and fastest, see benchmark.py for how much the
+# area and spatial features drift from the exact bilateral filter.
+DENOISE_METHODS = ['bilateral', 'downsampled', 'guided']
+
+# Image size reduction of the 'downsampled' method.
+DOWNSAMPLE_FACTOR = 2
+
+
+def bilateral(img, d=15, sigma_color=75, sigma_space=75, dst=None):
+    """The exact bilateral filter."""
+    return cv2.bilateralFilter(img, d, sigma_color, sigma_space, dst=dst)
+
+
+def downsampled_bilateral(img, d=15, sigma_color=75, sigma_space=75,
+                          factor=DOWNSAMPLE_FACTOR, dst=None):
+    """Bilateral filter on an image shrunk by factor, scaled back up.
+
+    The neighborhood diameter and the spatial sigma are divided by factor so
+    that the filter covers the same area of the sample, which makes it about
+    factor^4 times cheaper.
+    """
+    small = cv2.resize(img, None, fx=1.0 / factor, fy=1.0 / factor,
+                       interpolation=cv2.INTER_AREA)
+    small = cv2.bilateralFilter(small, max(1, d // factor), sigma_color,
+                                sigma_space / factor)
+    return cv2.resize(small, (img.shape[1], img.shape[0]), dst=dst,
+                      interpolation=cv2.INTER_LINEAR)
+
+
+def guided(img, d=15, sigma_color=75, dst=None):
+    """Self-guided filter (He et al., 2010) with box filters.
+
+    Within every window of diameter d the output is a linear function of the
+    input, flattened where the local standard deviation is small compared to
+    sigma_color and kept where it is large. The cost does not depend on d.
+    """
+    ksize = (d // 2 * 2 + 1,) * 2
+    eps = float(sigma_color) ** 2
+    I = img.astype(np.float32)
+    mean = cv2.boxFilter(I, -1, ksize)
+    var = cv2.boxFilter(I * I, -1, ksize) - mean * mean
+    a = var / (var + eps)
+    b = mean - a * mean
+    q = cv2.boxFilter(a, -1, ksize) * I + cv2.boxFilter(b, -1, ksize)
+    if dst is None:
+        dst = np.empty(img.shape, np.uint8)
+    # Round and saturate to 8 bits like the other filters.
+    q.round(out=q)
+    np.clip(q, 0, 255, out=q)
+    dst[...] = q
+    return dst
+
+
+def denoise(img, d=15, sigma_color=75, sigma_space=75, method='bilateral',
+            dst=None):
+    """Filter an 8-bit grayscale image with method, one of DENOISE_METHODS;
+    the result is written into dst if given."""
+    if method == 'bilateral':
+        return bilateral(img, d, sigma_color, sigma_space, dst=dst)
+    elif method == 'downsampled':
+        return downsampled_bilateral(img, d, sigma_color, sigma_space,
+                                     dst=dst)
+    elif method == 'guided':
+        return guided(img, d, sigma_color, dst=dst)
+    else:
+        raise ValueError('Unknown denoising method: {:s}'.format(method))
@@ -8,224 +8,337 @@ from __future__ import absolute_import
 
 import os
 import sys
+import time
 
 import numpy as np
 import cv2
-import seaborn as sns
-from matplotlib import pyplot as plt
-
-import mahotas.features
-from skimage.feature import local_binary_pattern
-
-import utils
-
-# Set Matplotlib and Seaborn params
-rc = {"axes.spines.left" : False,
-      "axes.spines.right" : False,
-      "axes.spines.bottom" : False,
-      "axes.spines.top" : False,
-      "xtick.bottom" : False,
-      "xtick.labelbottom" : False,
-      "ytick.labelleft" : False,
-      "ytick.left" : False}
-plt.rcParams.update(rc)
-sns.set_style('whitegrid', {'axes.grid': False})
-
-
-# Kernels for opening and closing.
-kernel3 = np.ones((3, 3), np.uint8)
-kernel5 = np.ones((5, 5), np.uint8)
-kernel7 = np.ones((7, 7), np.uint8)
-kernel9 = np.ones((9, 9), np.uint8)
-kernel11 = np.ones((11, 11), np.uint8)
-
-
-def haralick_features(image_names, distance=1):
-    f = []
-    for i in range(len(image_names)):
-        img = cv2.imread(image_names[i])
-        img = utils.crop_image(img)
-        if img is None or img.size == 0 or np.sum(img[:]) == 0 or img.shape[0] == 0 or img.shape[1] == 0:
-            h = np.zeros((1, 13))
-        else:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            h = mahotas.features.haralick(img, distance=distance, return_mean=True, ignore_zeros=False)
-            h = np.expand_dims(h, 0)
-        if i == 0:
-            f = h
-        else:
-            f = np.vstack((f, h))
-    return f
+from features.cache import file_digest, digest_file
+from features.core import (Workspace, segment, area_statistics,
+                           spatial_statistics, morphology_statistics,
+                           segmentation_image)
+from features.imagesource import (ImageSource, read_image, crop_rows,
+                                  crop_image)
+from features.parallel import imap_images
+from features.texture import (haralick as texture_haralick, lbp as texture_lbp,
+                               lbp_histograms)
+from features.tiling import segment_tiled
 
+# Scratch buffers of the segmentation, reused by every image this process
+# collects features from.
+_workspace = Workspace()
 
-def lbp_features(image_names, P=10, R=5):
-    f = []
-    for i in range(len(image_names)):
-        img = cv2.imread(image_names[i])
-        img = utils.crop_image(img)
-        if img is None or img.size == 0 or np.sum(img[:]) == 0 or img.shape[0] == 0 or img.shape[1] == 0:
-            h = np.zeros((1, 13))
-        else:
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            lbp = local_binary_pattern(img, P=P, R=R)
-            # h, _ = np.histogram(lbp, normed=True, bins=P + 2, range=(0, P + 2))
-            h, _ = np.histogram(lbp, bins=P+2, range=(0, P+2), density=True)
-        if i == 0:
-            f = h
-        else:
-            f = np.vstack((f, h))
-    return f
+# Order of the feature families in a feature vector.
+FEATURE_ORDER = ['area', 'spatial', 'morphology', 'haralick', 'lbp']
 
+# Length of the feature vector of each feature family; LBP features have
+# P + 2 entries.
+FEATURE_SIZES = {
+    'area': 3,
+    'spatial': 14,
+    'morphology': 12,
+    'haralick': 13
+}
 
-def spatial(image_name, d=15, sigma_color=75, sigma_space=75,
-            with_info_bar=True):
-    img = cv2.imread(image_name, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise FileNotFoundError("Image {:s} cannot be opened."
-                                .format(image_name))
 
-    if with_info_bar:
-        img = utils.crop_image(img)
-    img = cv2.bilateralFilter(img, d, sigma_color, sigma_space)
-
-    # Apply KMeans.
-    Z = img.astype(np.float32).reshape((-1, 1))
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1.0)
-    ret, label, center = cv2.kmeans(Z, 2, None, criteria, 10,
-                                    cv2.KMEANS_PP_CENTERS)
-    center = np.uint8(center)
-    res = center[label.flatten()]
-    res2 = res.reshape(img.shape)
-
-    # Apply closing then opening.
-    p3 = np.array(res2, copy=True)
-    p3[np.where(res2 != min(set(p3.flatten())))] = 255
-    p3 = cv2.morphologyEx(p3, cv2.MORPH_CLOSE, kernel9)
-    p3 = cv2.morphologyEx(p3, cv2.MORPH_OPEN, kernel9)
-
-    # Apply closing then opening.
-    p2 = np.array(res2, copy=True)
-    p2[np.where(p2 != min(set(p2.flatten())))] = 255
-    p2 = cv2.morphologyEx(p2, cv2.MORPH_OPEN, kernel9)
-    p2 = cv2.morphologyEx(p2, cv2.MORPH_CLOSE, kernel3)
-    p2[np.where(p3 != 255)] = 255
-
-    p2 = 255 - p2
-    p3 = 255 - p3
-
-    connectivity = 8
-    num_labels, labels, stats, centroids = \
-        cv2.connectedComponentsWithStats(p2, connectivity, cv2.CV_32S)
-    f = [
-        num_labels - 1,             # number of regions                 0
-        np.mean(stats[1:, -1]),     # mean of region areas              1
-        np.std(stats[1:, -1]),      # std of region areas               2
-        np.std(centroids[1:, 0]),   # std of the x-axis of centroid     3
-        np.std(centroids[1:, 1]),   # std of the y-axis of centroids    4
-        # mean and std of (width * height / area)
-        np.mean(stats[1:, 2] * stats[1:, 3] / stats[1:, 4]),          # 5
-        np.std(stats[1:, 2] * stats[1:, 3] / stats[1:, 4])            # 6
-    ]
-
-    connectivity = 8
-    num_labels, labels, stats, centroids = \
-        cv2.connectedComponentsWithStats(p3, connectivity, cv2.CV_32S)
-    f += [
-        num_labels - 1,  # number of regions                            7
-        np.mean(stats[1:, -1]),  # mean of region areas                 8
-        np.std(stats[1:, -1]),  # std of region areas                   9
-        np.std(centroids[1:, 0]),  # std of the x-axis of centroid     10
-        np.std(centroids[1:, 1]),  # std of the y-axis of centroids    11
-        # mean and std of (width * height / area)
-        np.mean(stats[1:, 2] * stats[1:, 3] / stats[1:, 4]),         # 12
-        np.std(stats[1:, 2] * stats[1:, 3] / stats[1:, 4])           # 13
-    ]
-    return f
+def feature_size(feature_names, P=10):
+    return sum(P + 2 if fn == 'lbp' else FEATURE_SIZES[fn]
+               for fn in feature_names)
 
 
-def spatial_features(image_names, d=15, sigma_color=75, sigma_space=75,
-                     with_info_bar=True):
-    features = []
-    for i in image_names:
-        try:
-            feature = spatial(i, d, sigma_color, sigma_space, with_info_bar)
-        except FileNotFoundError as e:
-            print("File not found ({}): {}".format(e.errno, e.strerror))
-            continue
-        if len(features) == 0:
-            features = feature
-        else:
-            features = np.vstack((features, feature))
+def feature_columns(feature_names, P=10):
+    """Column names of the feature table, e.g. area_0, ..., lbp_11."""
+    columns = []
+    for fn in FEATURE_ORDER:
+        if fn in feature_names:
+            columns += ['{:s}_{:d}'.format(fn, i)
+                        for i in range(feature_size([fn], P))]
+    return columns
+
+
+def haralick(img, distance=1):
+    if img.size == 0 or not img.any():
+        return np.zeros(13)
+    return texture_haralick(img, distance)
+
+
+def lbp(img, P=10, R=5):
+    if img.size == 0 or not img.any():
+        return np.zeros(P + 2)
+    return texture_lbp(img, P, R)
+
+
+def lbp_scales(img, scales):
+    """lbp of img for every (P, R) of scales, in one pass over the image."""
+    if img.size == 0 or not img.any():
+        return [np.zeros(P + 2) for P, _ in scales]
+    return lbp_histograms(img, scales)
+
+
+def haralick_features(image_names, distance=1, n_workers=1):
+    return collect_image_features(image_names, ['haralick'],
+                                  n_workers=n_workers, distance=distance)
+
 
-    return features
+def lbp_features(image_names, P=10, R=5, n_workers=1):
+    return collect_image_features(image_names, ['lbp'], n_workers=n_workers,
+                                  P=P, R=R)
+
+
+def spatial(image_name, d=15, sigma_color=75, sigma_space=75,
+            with_info_bar=True, clustering='histogram', denoise='bilateral',
+            level=0, ksize0=9, ksize1=9, ksize2=9, ksize3=3):
+    img = read_image(image_name, crop_rows if with_info_bar else None)
+    seg = segment(img, d, sigma_color, sigma_space, ksize0, ksize1, ksize2,
+                  ksize3, clustering=clustering, denoise=denoise, level=level)
+    return spatial_statistics(seg)
+
+
+def spatial_features(image_names, d=15, sigma_color=75, sigma_space=75,
+                     with_info_bar=True, clustering='histogram',
+                     denoise='bilateral', level=0, ksize0=9, ksize1=9,
+                     ksize2=9, ksize3=3, n_workers=1):
+    return collect_image_features(image_names, ['spatial'],
+                                  n_workers=n_workers, d=d,
+                                  sigma_color=sigma_color,
+                                  sigma_space=sigma_space,
+                                  with_info_bar=with_info_bar,
+                                  clustering=clustering, denoise=denoise,
+                                  level=level, ksize0=ksize0,
+                                  ksize1=ksize1, ksize2=ksize2,
+                                  ksize3=ksize3)
+
+
+def morphology_features(image_names, d=15, sigma_color=75, sigma_space=75,
+                        with_info_bar=True, clustering='histogram',
+                        denoise='bilateral', level=0, ksize0=9, ksize1=9,
+                        ksize2=9, ksize3=3, n_workers=1):
+    return collect_image_features(image_names, ['morphology'],
+                                  n_workers=n_workers, d=d,
+                                  sigma_color=sigma_color,
+                                  sigma_space=sigma_space,
+                                  with_info_bar=with_info_bar,
+                                  clustering=clustering, denoise=denoise,
+                                  level=level, ksize0=ksize0,
+                                  ksize1=ksize1, ksize2=ksize2,
+                                  ksize3=ksize3)
 
 
 def segmentation(img, d=15, sigma_color=75, sigma_space=75,
-                 with_info_bar=True, visualization=True):
+                 with_info_bar=True, visualization=True,
+                 clustering='histogram', denoise='bilateral', level=0,
+                 ksize0=9, ksize1=9, ksize2=9, ksize3=3):
     if with_info_bar:
-        img = utils.crop_image(img)
-    img = cv2.bilateralFilter(img, d, sigma_color, sigma_space)
-
-    # Apply KMeans.
-    Z = img.astype(np.float32).reshape((-1, 1))
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1.0)
-    ret, label, center = cv2.kmeans(Z, 2, None, criteria, 10,
-                                    cv2.KMEANS_PP_CENTERS)
-    center = np.uint8(center)
-    res = center[label.flatten()]
-    res2 = res.reshape(img.shape)
-
-    # Apply closing then opening.
-    p3 = np.array(res2, copy=True)
-    p3[np.where(res2 != min(set(p3.flatten())))] = 255
-    p3 = cv2.morphologyEx(p3, cv2.MORPH_CLOSE, kernel9)
-    p3 = cv2.morphologyEx(p3, cv2.MORPH_OPEN, kernel9)
-    p3_feature = np.sum(p3 != 255) / (img.shape[0]*img.shape[1])
-
-    # Apply closing then opening.
-    p2 = np.array(res2, copy=True)
-    p2[np.where(p2 != min(set(p2.flatten())))] = 255
-    p2 = cv2.morphologyEx(p2, cv2.MORPH_OPEN, kernel9)
-    p2 = cv2.morphologyEx(p2, cv2.MORPH_CLOSE, kernel3)
-    p2[np.where(p3 != 255)] = 255
-    p2_feature = np.sum(p2 != 255) / (img.shape[0]*img.shape[1])
-
-    features = np.asarray([1 - p2_feature - p3_feature, p2_feature, p3_feature])
+        img = crop_image(img)
+    seg = segment(img, d, sigma_color, sigma_space, ksize0, ksize1, ksize2,
+                  ksize3, clustering=clustering, denoise=denoise, level=level,
+                  components=False)
+    features = area_statistics(seg)
 
     if visualization:
-        colors = [(219, 94, 86),
-                  (86, 219, 127),
-                  (86, 111, 219)]
-        seg_img = np.zeros((img.shape[0], img.shape[1], 3), dtype=np.int32)
-        seg_img[(p2 == 255) * (p3 == 255)] = colors[0]
-        seg_img[p2 != 255] = colors[1]
-        seg_img[p3 != 255] = colors[2]
-        return features, seg_img
+        return features, segmentation_image(seg, np.int32)
     else:
         return features
 
 
 def area_features(image_names, d=15, sigma_color=75, sigma_space=75,
-                  with_info_bar=True):
-    features = []
-    for i in image_names:
-        try:
-            img = cv2.imread(i, cv2.IMREAD_GRAYSCALE)
+                  with_info_bar=True, clustering='histogram',
+                  denoise='bilateral', level=0, ksize0=9, ksize1=9,
+                  ksize2=9, ksize3=3, n_workers=1):
+    return collect_image_features(image_names, ['area'],
+                                  n_workers=n_workers, d=d,
+                                  sigma_color=sigma_color,
+                                  sigma_space=sigma_space,
+                                  with_info_bar=with_info_bar,
+                                  clustering=clustering, denoise=denoise,
+                                  level=level, ksize0=ksize0,
+                                  ksize1=ksize1, ksize2=ksize2,
+                                  ksize3=ksize3)
+
+
+def tiled_image(image_name, with_info_bar=True):
+    """The first page of an image file as a 2D grayscale array for
+    segment_tiled, memory-mapped if the file allows it (see
+    ImageSource.array), cropped by crop_rows like the images read_image
+    gives."""
+    with ImageSource(image_name) as source:
+        img = source.array()
+    if with_info_bar:
+        img = img[:crop_rows(img.shape)]
+    return img
+
+
+def array_features(img, feature_names, d=15, sigma_color=75,
+                   sigma_space=75, distance=1, P=10, R=5,
+                   clustering='histogram', denoise='bilateral', level=0,
+                   ksize0=9, ksize1=9, ksize2=9, ksize3=3,
+                   tile_size=None, segmentation=False, times=None):
+    """Features of a decoded grayscale image, as a dict of the feature
+    vector of every family of feature_names.
+
+    The image is segmented once, if any family needs it, and every family
+    is computed from that segmentation. With segmentation=True, the
+    segmentation is returned as well (None if it was not needed or ran
+    tiled). If times is a dict, the seconds spent segmenting and on the
+    features are stored in it under 'segment' and 'features'.
+    """
+    start = time.time()
+    features = {}
+    seg = None
+    segmented = [fn for fn in ['area', 'spatial', 'morphology']
+                 if fn in feature_names]
+    if len(segmented) > 0:
+        with_spatial = 'spatial' in segmented
+        if tile_size is not None:
+            tiled = segment_tiled(img, tile_size, d, sigma_color, sigma_space,
+                                  ksize0, ksize1, ksize2, ksize3,
+                                  clustering=clustering, denoise=denoise,
+                                  spatial=with_spatial)
+            area, spatial = tiled.area, tiled.spatial
+        else:
+            seg = segment(img, d, sigma_color, sigma_space, ksize0, ksize1,
+                          ksize2, ksize3, clustering=clustering,
+                          denoise=denoise, level=level,
+                          components=with_spatial or 'morphology' in segmented,
+                          workspace=_workspace)
+            area = area_statistics(seg)
+            spatial = spatial_statistics(seg) if with_spatial else None
+            if 'morphology' in segmented:
+                features['morphology'] = np.asarray(
+                    morphology_statistics(seg))
+        if 'area' in segmented:
+            features['area'] = area
+        if with_spatial:
+            features['spatial'] = np.asarray(spatial)
+    if times is not None:
+        times['segment'] = time.time() - start
+
+    start = time.time()
+    if 'haralick' in feature_names:
+        features['haralick'] = haralick(img, distance)
+    if 'lbp' in feature_names:
+        features['lbp'] = lbp(img, P, R)
+    if times is not None:
+        times['features'] = time.time() - start
+
+    if segmentation:
+        return features, seg
+    else:
+        return features
+
+
+def image_features(image_name, feature_names, d=15, sigma_color=75,
+                   sigma_space=75, with_info_bar=True, distance=1, P=10, R=5,
+                   clustering='histogram', denoise='bilateral', level=0,
+                   ksize0=9, ksize1=9, ksize2=9, ksize3=3,
+                   tile_size=None, cache=None):
+    """Feature vector of one image file.
+
+    The image is decoded once and segmented once; every requested feature
+    family is computed from that shared state (see array_features). Features
+    are ordered as in FEATURE_ORDER: area, spatial, morphology, Haralick and
+    LBP features.
+    With a FeatureCache, families found in the cache are not recomputed, and
+    the image is not decoded at all if every family is found.
+
+    With tile_size, the segmentation runs tile by tile (see
+    features.tiling.segment_tiled) and gives the same features, except for
+    the morphology features, which need the whole label images. The image is
+    then read by tiled_image, so an uncompressed TIFF file is memory-mapped
+    rather than decoded, and the Haralick and LBP features read it strip by
+    strip as well.
+    """
+    if tile_size is not None and level > 0:
+        raise ValueError('Tiled segmentation does not support pyramid '
+                         'levels.')
+    if tile_size is not None and 'morphology' in feature_names:
+        raise ValueError('Tiled segmentation does not support morphology '
+                         'features.')
+    feature_names = [fn for fn in FEATURE_ORDER if fn in feature_names]
+    found = {}
+    if cache is None:
+        if tile_size is not None:
+            img = tiled_image(image_name, with_info_bar)
+        else:
+            # Only the rows above the info bar are decoded, where possible.
+            img = read_image(image_name,
+                             crop_rows if with_info_bar else None)
+    else:
+        params = {'with_info_bar': with_info_bar, 'd': d,
+                  'sigma_color': sigma_color, 'sigma_space': sigma_space,
+                  'ksize0': ksize0, 'ksize1': ksize1, 'ksize2': ksize2,
+                  'ksize3': ksize3,
+                  'clustering': clustering, 'denoise': denoise,
+                  'level': level, 'distance': distance,
+                  'P': P, 'R': R}
+        if tile_size is not None:
+            digest = digest_file(image_name)
+        else:
+            with open(image_name, 'rb') as f:
+                data = f.read()
+            digest = file_digest(data)
+        keys = {fn: cache.key(digest, fn, params) for fn in feature_names}
+        for fn in feature_names:
+            value = cache.get(keys[fn])
+            if value is not None:
+                found[fn] = value
+        if len(found) == len(feature_names):
+            return np.concatenate([found[fn] for fn in feature_names])
+        if tile_size is not None:
+            img = tiled_image(image_name, with_info_bar)
+        else:
+            img = cv2.imdecode(np.frombuffer(data, np.uint8),
+                               cv2.IMREAD_GRAYSCALE)
             if img is None:
                 raise FileNotFoundError("Image {:s} cannot be opened."
-                                        .format(i))
-            feature = segmentation(img, d, sigma_color, sigma_space,
-                                   with_info_bar=with_info_bar,
-                                   visualization=False)
-        except FileNotFoundError as e:
-            print("File not found ({}): {}".format(e.errno, e.strerror))
+                                        .format(image_name))
+            if with_info_bar:
+                img = crop_image(img)
+
+    computed = array_features(
+        img, [fn for fn in feature_names if fn not in found], d, sigma_color,
+        sigma_space, distance, P, R, clustering, denoise, level,
+        ksize0, ksize1, ksize2, ksize3, tile_size)
+
+    if cache is not None:
+        for fn in computed:
+            cache.put(keys[fn], computed[fn])
+    found.update(computed)
+    return np.concatenate([found[fn] for fn in feature_names])
+
+
+def collect_image_features(image_names, feature_names, n_workers=1,
+                           executor=None, chunksize=None, errors=None,
+                           **kwargs):
+    """Feature matrix of image files, one row per readable image.
+
+    Images are spread over a pool of n_workers processes (or the given
+    executor) and rows come back in the order of image_names. Images that
+    fail are reported and skipped; if errors is a list, (image name, message)
+    pairs are appended to it.
+    """
+    image_names = list(image_names)
+
+    # Rows are written into a preallocated matrix; failed images are
+    # compacted away at the end.
+    features = np.empty((len(image_names),
+                         feature_size(feature_names, kwargs.get('P', 10))))
+    n = 0
+    for image_name, feature, error in imap_images(
+            image_features, image_names, n_workers=n_workers,
+            executor=executor, chunksize=chunksize,
+            feature_names=feature_names, **kwargs):
+        if error is not None:
+            print('Failed to collect features from {:s}: {:s}'
+                  .format(image_name, error))
+            if errors is not None:
+                errors.append((image_name, error))
             continue
-        if len(features) == 0:
-            features = feature
-        else:
-            features = np.vstack((features, feature))
+        features[n] = feature
+        n += 1
 
-    return features
+    if n == 0:
+        return []
+    return features[:n]
 
 
 if __name__ == '__main__':
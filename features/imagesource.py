@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : imagesource.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+
+import cv2
+import numpy as np
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+TIFF_EXTENSIONS = ['.tif', '.tiff']
+
+# Number of rows above the info bar of the images of each known size.
+INFO_BAR_ROWS = {
+    (2048, 2560): 1920,
+    (1428, 2048): 1408,
+    (1024, 1280): 960,
+    (1448, 2048): 1428
+}
+
+
+def crop_rows(shape):
+    """Number of rows above the info bar of an image of the given shape.
+    Images of sizes not in INFO_BAR_ROWS have no known info bar and are kept
+    whole."""
+    return INFO_BAR_ROWS.get(tuple(shape[:2]), shape[0])
+
+
+def crop_image(image):
+    return image[:crop_rows(image.shape), :]
+
+
+def _to_8bit(img):
+    """8-bit copy of an 8 or 16-bit image, scaled like cv2.imread does."""
+    if img.dtype == np.uint8:
+        return np.array(img)
+    return (img >> 8).astype(np.uint8)
+
+
+# cv2.imread converts to grayscale with the fixed point weights
+# (4899 R + 9617 G + 1868 B + 2^13) >> 14, which round differently from
+# cv2.cvtColor. The offset makes cv2.transform round halves up like the
+# shift does, which gives the same values for all 2^24 colors.
+_RGB_TO_GRAY = np.array([[4899 / 16384, 9617 / 16384, 1868 / 16384,
+                          1 / 32768]])
+
+
+def _rgb_to_gray(img):
+    return cv2.transform(np.ascontiguousarray(img[:, :, :3]),
+                         _RGB_TO_GRAY).reshape(img.shape[:2])
+
+
+def _convert(img, gray):
+    """Grayscale (gray=True) or BGR image from a grayscale, RGB or RGBA
+    array as stored in a TIFF file."""
+    img = _to_8bit(img)
+    if img.ndim == 3 and img.shape[2] == 1:
+        img = img[:, :, 0]
+    if img.ndim == 2:
+        return img if gray else cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] not in [3, 4]:
+        raise ValueError('Unsupported number of samples per pixel.')
+    if gray:
+        return _rgb_to_gray(img)
+    return cv2.cvtColor(img[:, :, :3], cv2.COLOR_RGB2BGR)
+
+
+class ImageSource(object):
+    """An image file that is only decoded as far as it is read.
+
+    Uncompressed TIFF pages are memory-mapped, and only the strips of
+    compressed TIFF pages that hold the requested rows are decoded; this
+    needs the optional tifffile package. Multi-page TIFF files are read page
+    by page. Other files, TIFF files without tifffile and TIFF layouts not
+    handled here are decoded whole by OpenCV.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tiff = None
+        if tifffile is not None and \
+                os.path.splitext(filename)[1].lower() in TIFF_EXTENSIONS:
+            try:
+                self.tiff = tifffile.TiffFile(filename)
+            except Exception:
+                self.tiff = None
+
+    def close(self):
+        if self.tiff is not None:
+            self.tiff.close()
+            self.tiff = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def n_pages(self):
+        return len(self.tiff.pages) if self.tiff is not None else 1
+
+    def _page(self, page):
+        """The tifffile page, if it can be read here: grayscale or RGB(A),
+        8 or 16-bit, stored by strips or contiguously."""
+        if self.tiff is None:
+            return None
+        p = self.tiff.pages[page]
+        if p.is_tiled or p.dtype not in [np.uint8, np.uint16] or \
+                p.photometric not in [1, 2] or \
+                (p.samplesperpixel > 1 and p.planarconfig != 1):
+            return None
+        return p
+
+    def _read_rows(self, page, p, rows):
+        if p.is_memmappable:
+            return tifffile.memmap(self.filename, page=page, mode='r')[:rows]
+
+        # Decode the strips holding the first rows only.
+        rows_per_strip = min(p.rowsperstrip or p.imagelength, p.imagelength)
+        fh = self.tiff.filehandle
+        strips = []
+        for i in range(-(-rows // rows_per_strip)):
+            fh.seek(p.dataoffsets[i])
+            data = fh.read(p.databytecounts[i])
+            strip, _, shape = p.decode(data, i,
+                                       jpegtables=getattr(p, 'jpegtables',
+                                                          None))
+            strips.append(strip.reshape(shape)[0])
+        return np.concatenate(strips)[:rows]
+
+    def read(self, page=0, crop=None, gray=True):
+        """A page as an 8-bit grayscale (gray=True) or BGR image, like
+        cv2.imread. crop is a function of the image shape returning the
+        number of rows to keep, e.g. crop_rows; rows below them are
+        not decoded if the file allows it."""
+        p = self._page(page)
+        if p is not None:
+            rows = crop(p.shape[:2]) if crop is not None else p.shape[0]
+            try:
+                return _convert(self._read_rows(page, p, rows), gray)
+            except (ValueError, NotImplementedError, KeyError):
+                pass
+
+        img = cv2.imread(self.filename,
+                         cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR)
+        if img is None:
+            raise FileNotFoundError("Image {:s} cannot be opened."
+                                    .format(self.filename))
+        if crop is not None:
+            img = img[:crop(img.shape[:2])]
+        return img
+
+    def array(self, page=0):
+        """A page as a 2D 8-bit grayscale array, without loading it if it
+        is stored uncompressed as such; e.g. for features.tiling."""
+        p = self._page(page)
+        if p is not None and p.is_memmappable and p.dtype == np.uint8 and \
+                p.samplesperpixel == 1:
+            return tifffile.memmap(self.filename, page=page, mode='r')
+        return self.read(page)
+
+
+def read_image(filename, crop=None, gray=True):
+    """The first page of an image file, see ImageSource.read."""
+    with ImageSource(filename) as source:
+        return source.read(0, crop, gray)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : parallel.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _apply_chunk(func, items, kwargs):
+    results = []
+    for item in items:
+        try:
+            results.append((func(item, **kwargs), None))
+        except Exception as e:
+            results.append((None, '{:s}: {}'.format(type(e).__name__, e)))
+    return results
+
+
+def default_chunksize(n_items, n_workers):
+    """About four chunks per worker, so that slow images even out."""
+    return max(1, min(16, n_items // (4 * n_workers)))
+
+
+def imap_images(func, items, n_workers=1, executor=None, chunksize=None,
+                **kwargs):
+    """Apply func(item, **kwargs) to every item over a process pool.
+
+    Yields (item, result, error) in the order of items, whatever order the
+    workers finish in. A failure is reported for its own item only: result is
+    None and error is a message. Items are scheduled in chunks of chunksize,
+    with a bounded number of chunks in flight. If an executor is given it is
+    used and left running, otherwise a pool of n_workers processes is created
+    (n_workers=None uses all cores) and n_workers=1 runs in this process.
+    """
+    items = list(items)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if executor is None and n_workers <= 1:
+        for item in items:
+            (result, error), = _apply_chunk(func, [item], kwargs)
+            yield item, result, error
+        return
+
+    if executor is None:
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+    else:
+        pool = executor
+        n_workers = getattr(executor, '_max_workers', n_workers)
+    if chunksize is None:
+        chunksize = default_chunksize(len(items), n_workers)
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+
+    pending = []
+    try:
+        next_chunk = 0
+        for chunk in chunks:
+            # Keep two chunks per worker queued.
+            while next_chunk < len(chunks) and len(pending) < 2 * n_workers:
+                pending.append(pool.submit(_apply_chunk, func,
+                                           chunks[next_chunk], kwargs))
+                next_chunk += 1
+            try:
+                results = pending.pop(0).result()
+            except Exception as e:
+                # The worker itself died, e.g. BrokenProcessPool.
+                error = '{:s}: {}'.format(type(e).__name__, e)
+                results = [(None, error)] * len(chunk)
+            for item, (result, error) in zip(chunk, results):
+                yield item, result, error
+    finally:
+        for future in pending:
+            future.cancel()
+        if executor is None:
+            pool.shutdown(wait=True)
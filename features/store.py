@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : store.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+import zipfile
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Name of the array holding the index in .npz feature tables.
+INDEX_KEY = '__index__'
+
+
+def table_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ['.csv', '.npz', '.feather', '.parquet']:
+        raise ValueError('Unknown feature table format: {:s}'.format(path))
+    return ext[1:]
+
+
+def save_feature_table(df, path, float32=False):
+    """Save a feature table as csv, npz, feather or parquet, chosen by the
+    extension of path.
+
+    .npz tables are uncompressed with one array per column, so they can be
+    loaded column by column and memory-mapped without any extra dependency;
+    feather and parquet need pyarrow. With float32=True float columns are
+    stored in single precision.
+    """
+    fmt = table_format(path)
+    if float32:
+        df = df.astype({c: np.float32 for c in df.columns
+                        if df[c].dtype == np.float64})
+
+    if fmt == 'csv':
+        df.to_csv(path)
+    elif fmt == 'npz':
+        arrays = {INDEX_KEY: df.index.to_numpy()}
+        for c in df.columns:
+            values = df[c].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            arrays[str(c)] = values
+        # Keep the column order, which np.load does not preserve for us.
+        arrays['__columns__'] = np.array([str(c) for c in df.columns])
+        np.savez(path, **arrays)
+    elif fmt == 'feather':
+        df = df.copy()
+        df.insert(0, INDEX_KEY, df.index)
+        df.reset_index(drop=True).to_feather(path)
+    elif fmt == 'parquet':
+        df.to_parquet(path)
+
+
+def _memmap_npz(path, name):
+    """Memory-map an array stored uncompressed in an .npz file, or return
+    None if it cannot be mapped."""
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as f:
+        # The local file header is 30 bytes followed by the file name and
+        # an extra field, whose lengths are at offsets 26 and 28.
+        f.seek(info.header_offset + 26)
+        n = np.frombuffer(f.read(4), dtype='<u2')
+        f.seek(info.header_offset + 30 + int(n[0]) + int(n[1]))
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        if dtype.hasobject:
+            return None
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def load_feature_table(path, columns=None, mmap=True):
+    """Load a feature table saved by save_feature_table.
+
+    Only the given columns are read, if any. Columns of .npz tables are
+    memory-mapped when mmap is True, and feather tables are read through a
+    memory map.
+    """
+    fmt = table_format(path)
+    if fmt == 'csv':
+        usecols = None
+        if columns is not None:
+            usecols = lambda c: c in columns or c.startswith('Unnamed')
+        return pd.read_csv(path, index_col=0, usecols=usecols)
+    elif fmt == 'npz':
+        with np.load(path) as data:
+            if columns is None:
+                columns = list(data['__columns__'])
+            index = data[INDEX_KEY]
+            values = {}
+            for c in columns:
+                values[c] = _memmap_npz(path, c) if mmap else None
+                if values[c] is None:
+                    values[c] = data[c]
+        return pd.DataFrame(values, index=index, columns=columns, copy=False)
+    elif fmt == 'feather':
+        from pyarrow import feather
+        read = [INDEX_KEY] + list(columns) if columns is not None else None
+        df = feather.read_table(path, columns=read, memory_map=mmap) \
+            .to_pandas()
+        return df.set_index(INDEX_KEY).rename_axis(None)
+    elif fmt == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+
+
+if __name__ == '__main__':
+
+    # Convert a feature table, e.g. python -m features.store a.csv a.npz
+    parser = argparse.ArgumentParser(description='Convert a feature table.')
+    parser.add_argument('input', type=str, help='input feature table')
+    parser.add_argument('output', type=str, help='output feature table')
+    parser.add_argument('--float32', action='store_true',
+                        help='store float columns in single precision')
+    args = parser.parse_args()
+
+    save_feature_table(load_feature_table(args.input), args.output,
+                       float32=args.float32)
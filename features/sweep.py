@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : sweep.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+import argparse
+import itertools
+
+import numpy as np
+
+from features.core import (Workspace, Segmentation, pyramid, level_params,
+                           two_means_threshold, phase_masks, upsample_masks,
+                           connected_components, area_statistics,
+                           spatial_statistics, morphology_statistics)
+from features.denoise import denoise as denoise_image
+from features.features import (FEATURE_ORDER, feature_columns, haralick,
+                               lbp_scales)
+from features.imagesource import read_image, crop_rows
+from features.parallel import imap_images
+from features.table import make_feature_table
+
+# Parameters a sweep can vary, with their default values.
+SWEEP_PARAMS = {
+    'with_info_bar': True,
+    'd': 15,
+    'sigma_color': 75,
+    'sigma_space': 75,
+    'ksize0': 9,
+    'ksize1': 9,
+    'ksize2': 9,
+    'ksize3': 3,
+    'clustering': 'histogram',
+    'denoise': 'bilateral',
+    'level': 0,
+    'distance': 1,
+    'P': 10,
+    'R': 5
+}
+
+# Stages of the feature computation, in the order they depend on each
+# other; the features of area, spatial and morphology come from the masks.
+STAGES = ['image', 'pyramid', 'filtered', 'threshold', 'masks', 'haralick',
+          'lbp']
+
+
+def parameter_grid(grid, base=None):
+    """Every combination of the values of grid, a dict from parameter names
+    to a value or a list of values, as a list of complete settings (dicts
+    with every parameter of SWEEP_PARAMS). Parameters not in grid take their
+    value in base, if given, or their default."""
+    for name in grid:
+        if name not in SWEEP_PARAMS:
+            raise ValueError('Unknown parameter: {:s}'.format(name))
+    names = list(grid)
+    values = [grid[n] if isinstance(grid[n], (list, tuple)) else [grid[n]]
+              for n in names]
+    defaults = dict(SWEEP_PARAMS)
+    if base is not None:
+        defaults.update((n, v) for n, v in base.items() if n in SWEEP_PARAMS)
+    settings = []
+    for combination in itertools.product(*values):
+        setting = dict(defaults)
+        setting.update(zip(names, combination))
+        settings.append(setting)
+    return settings
+
+
+def parse_grid(text):
+    """Parameter grid from a string such as 'd=9,15; ksize0=7,9,11', with
+    values converted to the type of their default."""
+    grid = {}
+    for item in text.split(';'):
+        if item.strip() == '':
+            continue
+        if '=' not in item:
+            raise ValueError('Expected name=values: {:s}'.format(item))
+        name, values = [x.strip() for x in item.split('=', 1)]
+        if name not in SWEEP_PARAMS:
+            raise ValueError('Unknown parameter: {:s}'.format(name))
+        default = SWEEP_PARAMS[name]
+        if isinstance(default, bool):
+            convert = lambda v: v.lower() in ['true', '1', 'yes']
+        else:
+            convert = type(default)
+        grid[name] = [convert(v.strip()) for v in values.split(',')
+                      if v.strip() != '']
+    return grid
+
+
+def stage_keys(setting):
+    """Key of every stage of a setting: two settings share a stage, and its
+    result, when they have the same key. Keys hold the parameters as the
+    stage sees them, e.g. scaled to the pyramid level, and leave out those
+    it ignores."""
+    s = setting
+    d, sigma_space, ksize0, ksize1, ksize2, ksize3 = level_params(
+        s['level'], s['d'], s['sigma_space'], s['ksize0'], s['ksize1'],
+        s['ksize2'], s['ksize3'])
+    image = (s['with_info_bar'],)
+    pyr = image + (s['level'],)
+    if s['denoise'] == 'guided':
+        # The guided filter has no spatial sigma.
+        sigma_space = None
+    filtered = pyr + (s['denoise'], d, s['sigma_color'], sigma_space)
+    threshold = filtered + (s['clustering'],)
+    masks = threshold + (ksize0, ksize1, ksize2, ksize3)
+    return {'image': image, 'pyramid': pyr, 'filtered': filtered,
+            'threshold': threshold, 'masks': masks,
+            'haralick': image + (s['distance'],),
+            'lbp': image + (s['P'], s['R'])}
+
+
+def distinct_stages(settings, feature_names):
+    """Number of times every stage runs per image in a sweep over settings;
+    a full pass per setting would run each len(settings) times."""
+    stages = ['image']
+    if any(fn in feature_names for fn in ['area', 'spatial', 'morphology']):
+        stages += ['pyramid', 'filtered', 'threshold', 'masks']
+    stages += [fn for fn in ['haralick', 'lbp'] if fn in feature_names]
+    keys = [stage_keys(s) for s in settings]
+    # All LBP scales of an image are computed in one pass.
+    return {stage: len(set(k['image' if stage == 'lbp' else stage]
+                           for k in keys)) for stage in stages}
+
+
+def _order(keys, stages):
+    """Indices of keys ordered so that settings sharing a stage are
+    consecutive, at every stage."""
+    ranks = [{} for _ in stages]
+    order = []
+    for i, k in enumerate(keys):
+        rank = tuple(r.setdefault(k[stage], len(r))
+                     for r, stage in zip(ranks, stages))
+        order.append((rank, i))
+    return [i for _, i in sorted(order)]
+
+
+def sweep_image(img, settings, feature_names, counts=None, crop=None,
+                workspace=None):
+    """Feature vectors of a grayscale image (with its info bar) for every
+    setting, computed as a DAG of stages (see STAGES and stage_keys).
+
+    Settings are visited so that those sharing a stage are consecutive, and
+    every stage runs once per distinct key: one filtered image feeds all
+    clusterings and kernel sizes, one thresholded image all kernel sizes,
+    and so on; Haralick features run once per distance and all LBP scales
+    in one pass over the image. Only the last result of every image stage
+    is kept, so memory does not grow with the number of settings. The
+    number of times each stage ran is added to counts, if given. Features
+    are the same as those of features.features.image_features. crop gives
+    the number of rows to keep of an image with an info bar (crop_rows by
+    default).
+    """
+    ws = workspace if workspace is not None else Workspace()
+    feature_names = [fn for fn in FEATURE_ORDER if fn in feature_names]
+    segmentation = [fn for fn in ['area', 'spatial', 'morphology']
+                    if fn in feature_names]
+    keys = [stage_keys(s) for s in settings]
+    counts = counts if counts is not None else {}
+    crop = crop if crop is not None else crop_rows
+
+    def count(stage):
+        counts[stage] = counts.get(stage, 0) + 1
+
+    images = {}
+
+    def image(setting, key):
+        if key not in images:
+            images[key] = img[:crop(img.shape)] \
+                if setting['with_info_bar'] else img
+            count('image')
+        return images[key]
+
+    # Per-family results of every distinct key; these are small vectors.
+    results = {fn: {} for fn in ['segmentation', 'haralick', 'lbp']}
+
+    if len(segmentation) > 0:
+        stages = ['image', 'pyramid', 'filtered', 'threshold', 'masks']
+        last = {}
+        for i in _order(keys, stages):
+            s, k = settings[i], keys[i]
+            if k['masks'] in results['segmentation']:
+                continue
+            if last.get('pyramid', (None,))[0] != k['pyramid']:
+                last['pyramid'] = (k['pyramid'],
+                                   pyramid(image(s, k['image']), s['level']))
+                count('pyramid')
+            full = image(s, k['image'])
+            small = last['pyramid'][1]
+            d, sigma_space, ksize0, ksize1, ksize2, ksize3 = level_params(
+                s['level'], s['d'], s['sigma_space'], s['ksize0'],
+                s['ksize1'], s['ksize2'], s['ksize3'])
+            if last.get('filtered', (None,))[0] != k['filtered']:
+                filtered = ws.get('filtered', small.shape)
+                denoise_image(small, d, s['sigma_color'], sigma_space,
+                              s['denoise'], dst=filtered)
+                last['filtered'] = (k['filtered'], filtered)
+                count('filtered')
+            filtered = last['filtered'][1]
+            if last.get('threshold', (None,))[0] != k['threshold']:
+                last['threshold'] = (k['threshold'], two_means_threshold(
+                    filtered, s['clustering']))
+                count('threshold')
+            t = last['threshold'][1]
+
+            p2, p3 = phase_masks(filtered, t, ksize0, ksize1, ksize2, ksize3,
+                                 workspace=ws)
+            if s['level'] > 0:
+                p2, p3 = upsample_masks(p2, p3, full.shape, ws)
+            count('masks')
+            components2 = components3 = None
+            if 'spatial' in segmentation or 'morphology' in segmentation:
+                components2 = connected_components(p2, 'p2', ws)
+                components3 = connected_components(p3, 'p3', ws)
+            seg = Segmentation(filtered, t, p2, p3, components2, components3)
+            f = {}
+            if 'area' in segmentation:
+                f['area'] = area_statistics(seg)
+            if 'spatial' in segmentation:
+                f['spatial'] = np.asarray(spatial_statistics(seg))
+            if 'morphology' in segmentation:
+                f['morphology'] = np.asarray(morphology_statistics(seg))
+            results['segmentation'][k['masks']] = f
+
+    if 'haralick' in feature_names:
+        for s, k in zip(settings, keys):
+            if k['haralick'] not in results['haralick']:
+                results['haralick'][k['haralick']] = haralick(
+                    image(s, k['image']), s['distance'])
+                count('haralick')
+
+    if 'lbp' in feature_names:
+        # All (P, R) scales of an image in one pass.
+        scales = {}
+        for s, k in zip(settings, keys):
+            scales.setdefault(k['image'], (s, []))
+            if (s['P'], s['R']) not in scales[k['image']][1]:
+                scales[k['image']][1].append((s['P'], s['R']))
+        for key, (s, pr) in scales.items():
+            for (P, R), h in zip(pr, lbp_scales(image(s, key), pr)):
+                results['lbp'][key + (P, R)] = h
+            count('lbp')
+
+    features = []
+    for s, k in zip(settings, keys):
+        f = []
+        for fn in feature_names:
+            if fn in segmentation:
+                f.append(results['segmentation'][k['masks']][fn])
+            else:
+                f.append(results[fn][k[fn]])
+        features.append(np.concatenate(f))
+    return features
+
+
+def sweep_image_file(image_name, settings, feature_names, crop=None):
+    """Feature vectors of an image file for every setting, and the number
+    of times each stage ran, see sweep_image."""
+    counts = {}
+    img = read_image(image_name)
+    return sweep_image(img, settings, feature_names, counts, crop), counts
+
+
+def sweep_features(image_names, settings, feature_names, n_workers=1,
+                   executor=None, chunksize=None, errors=None, counts=None):
+    """Feature matrices of image files for every setting of a sweep.
+
+    settings is a list of settings or a grid (see parameter_grid). Returns
+    one matrix per setting, with a row per readable image in the order of
+    image_names, as collect_image_features does for one setting. Images are
+    spread over n_workers processes; the total number of times each stage
+    ran is added to counts, if given.
+    """
+    if isinstance(settings, dict):
+        settings = parameter_grid(settings)
+    image_names = list(image_names)
+    rows = [[] for _ in settings]
+    for image_name, result, error in imap_images(
+            sweep_image_file, image_names, n_workers=n_workers,
+            executor=executor, chunksize=chunksize, settings=settings,
+            feature_names=feature_names):
+        if error is not None:
+            print('Failed to collect features from {:s}: {:s}'
+                  .format(image_name, error))
+            if errors is not None:
+                errors.append((image_name, error))
+            continue
+        features, image_counts = result
+        for r, f in zip(rows, features):
+            r.append(f)
+        if counts is not None:
+            for stage, n in image_counts.items():
+                counts[stage] = counts.get(stage, 0) + n
+    return [np.array(r) for r in rows]
+
+
+def write_sweep(output_prefix, filenames, settings, features, feature_names):
+    """Save the feature tables of a sweep as <output_prefix>_<k>.csv, one
+    per setting, and the settings as <output_prefix>.csv, with the name of
+    the table of every setting. filenames are those of the rows."""
+    import pandas as pd
+    index = []
+    for k, (setting, f) in enumerate(zip(settings, features)):
+        table_file = '{:s}_{:03d}.csv'.format(output_prefix, k)
+        columns = feature_columns(feature_names, setting['P'])
+        f = np.reshape(f, (len(filenames), len(columns)))
+        make_feature_table(filenames, f, columns).to_csv(table_file)
+        index.append(dict(setting, table=os.path.basename(table_file)))
+    pd.DataFrame(index).to_csv(output_prefix + '.csv')
+
+
+if __name__ == '__main__':
+
+    # Sweep parameters over images, e.g.
+    # python -m features.sweep images/*.png --grid 'd=9,15; ksize0=7,9,11'
+    parser = argparse.ArgumentParser(description='Collect features of '
+                                     'images for every setting of a grid.')
+    parser.add_argument('images', type=str, nargs='+', help='image files')
+    parser.add_argument('--grid', type=str, required=True,
+                        help="parameter grid, e.g. 'd=9,15; ksize0=7,9,11'")
+    parser.add_argument('--features', type=str, nargs='+',
+                        default=['area', 'spatial', 'haralick', 'lbp'])
+    parser.add_argument('--output', type=str, default='sweep',
+                        help='prefix of the output tables')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    settings = parameter_grid(parse_grid(args.grid))
+    stages = distinct_stages(settings, args.features)
+    print('{:d} settings; stages per image: {:s}'.format(
+        len(settings), ', '.join('{:s} {:d}'.format(k, v)
+                                 for k, v in stages.items())))
+    errors = []
+    features = sweep_features(args.images, settings, args.features,
+                              n_workers=args.workers, errors=errors)
+    failed = set(name for name, _ in errors)
+    write_sweep(args.output, [f for f in args.images if f not in failed],
+                settings, features, args.features)
+    print('Saved {:s}.csv and {:d} feature tables.'.format(args.output,
+                                                           len(settings)))
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : table.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+
+from features.features import feature_columns, collect_image_features
+
+# Parameters of update_feature_table that change the feature values, and
+# their defaults. They are stored with the table, which is rebuilt when they
+# change.
+TABLE_PARAMS = {
+    'with_info_bar': True, 'd': 15, 'sigma_color': 75, 'sigma_space': 75,
+    'ksize0': 9, 'ksize1': 9, 'ksize2': 9, 'ksize3': 3,
+    'clustering': 'histogram', 'denoise': 'bilateral', 'level': 0,
+    'distance': 1, 'P': 10, 'R': 5
+}
+
+
+def file_signature(filename, by='mtime'):
+    """A string that changes whenever the file changes.
+
+    by='mtime' uses the modification time and the size of the file, which is
+    cheap; by='hash' uses the SHA-1 of its content, which survives copies
+    and touches.
+    """
+    if by == 'mtime':
+        st = os.stat(filename)
+        return 'mtime:{:d}:{:d}'.format(st.st_mtime_ns, st.st_size)
+    elif by == 'hash':
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return 'sha1:' + h.hexdigest()
+    else:
+        raise ValueError('Unknown signature type: {:s}'.format(by))
+
+
+def read_feature_table(table_file):
+    import pandas as pd
+    return pd.read_csv(table_file, index_col=0)
+
+
+def params_filename(table_file):
+    return table_file + '.params'
+
+
+def read_table_params(table_file):
+    """Columns and parameters a feature table was written with, or None if
+    they were not recorded."""
+    try:
+        with open(params_filename(table_file), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_table_params(table_file, columns, params):
+    tmp = params_filename(table_file) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'columns': columns, 'params': params}, f)
+    os.replace(tmp, params_filename(table_file))
+
+
+def make_feature_table(filenames, features, columns, signatures=None):
+    """Feature table with a filename column holding the basenames, and a
+    signature column if signatures are given."""
+    import pandas as pd
+    df = pd.DataFrame(data=features, columns=columns)
+    if signatures is not None:
+        df.insert(0, 'signature', value=signatures)
+    df.insert(0, 'filename', value=[os.path.basename(x) for x in filenames])
+    return df
+
+
+def stale_filenames(table, filenames, by='mtime', errors=None):
+    """Files that have no row in table or whose row is out of date.
+
+    Returns the stale filenames and a dict of their current signatures.
+    Tables written without a signature column are entirely out of date.
+    Files that cannot be read are reported and left out; if errors is a
+    list, (filename, message) pairs are appended to it.
+    """
+    known = {}
+    if table is not None and 'signature' in table.columns:
+        known = dict(zip(table['filename'], table['signature']))
+    stale = []
+    signatures = {}
+    for filename in filenames:
+        try:
+            signature = file_signature(filename, by)
+        except OSError as e:
+            error = '{:s}: {}'.format(type(e).__name__, e)
+            print('Failed to read {:s}: {:s}'.format(filename, error))
+            if errors is not None:
+                errors.append((filename, error))
+            continue
+        if known.get(os.path.basename(filename)) != signature:
+            stale.append(filename)
+            signatures[filename] = signature
+    return stale, signatures
+
+
+def merge_feature_tables(table, update):
+    """Rows of update replace the rows of table with the same filename;
+    other rows of table are kept. The result is sorted by filename."""
+    import pandas as pd
+    if table is None:
+        merged = update
+    else:
+        table = table.loc[~table['filename'].isin(update['filename'])]
+        merged = pd.concat([table, update], ignore_index=True)
+    return merged.sort_values('filename', kind='stable') \
+        .reset_index(drop=True)
+
+
+def update_feature_table(table_file, filenames, feature_names, by='mtime',
+                         **kwargs):
+    """Bring the feature table in table_file up to date with filenames.
+
+    Only images that are new or changed since the table was written are
+    processed; their rows are merged into the table, which is saved back to
+    table_file as csv and returned. The feature parameters are stored next
+    to the table (table_file + '.params'), and a table written with other
+    parameters is rebuilt. Files that cannot be read or processed are
+    reported and skipped. Remaining arguments are passed to
+    collect_image_features.
+    """
+    columns = feature_columns(feature_names, kwargs.get('P', 10))
+    params = {p: kwargs.get(p, v) for p, v in TABLE_PARAMS.items()}
+    table = None
+    if os.path.isfile(table_file):
+        table = read_feature_table(table_file)
+        if [c for c in table.columns
+                if c not in ['filename', 'signature']] != columns:
+            raise ValueError('The features in {:s} differ from the requested '
+                             'features.'.format(table_file))
+        if read_table_params(table_file) != {'columns': columns,
+                                             'params': params}:
+            print('The feature params of {:s} differ from the requested '
+                  'params; rebuilding it.'.format(table_file))
+            table = None
+
+    errors = []
+    stale, signatures = stale_filenames(table, filenames, by, errors=errors)
+    features = collect_image_features(stale, feature_names, errors=errors,
+                                      **kwargs)
+    failed = set(e[0] for e in errors)
+    stale = [x for x in stale if x not in failed]
+    if len(stale) == 0:
+        features = np.zeros((0, len(columns)))
+
+    update = make_feature_table(stale, features, columns,
+                                [signatures[x] for x in stale])
+    table = merge_feature_tables(table, update)
+    table.to_csv(table_file)
+    write_table_params(table_file, columns, params)
+    return table
+
+
+class FeatureTableWriter(object):
+    """Streams the rows of a feature table to disk as they are collected.
+
+    Rows go to table_file + '.partial' in batches of batch_size rows, or
+    every interval seconds, whichever comes first. After every batch the file
+    is flushed to disk and table_file + '.checkpoint' records how much of it
+    is complete, so that a run that is stopped or crashes can be resumed from
+    the rows it already wrote. finish() turns the partial file into
+    table_file and stores the columns and params next to it (see
+    read_table_params).
+    """
+
+    def __init__(self, table_file, columns, params=None, batch_size=16,
+                 interval=30.0):
+        self.table_file = table_file
+        self.partial_file = table_file + '.partial'
+        self.checkpoint_file = table_file + '.checkpoint'
+        self.columns = columns
+        self.params = params
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self.pending = []
+        self.n_rows = 0
+        self.size = 0
+        self.last_flush = time.time()
+
+    def resume(self):
+        """Rows written by an interrupted run with the same columns and
+        parameters, or None if there is nothing to resume."""
+        try:
+            with open(self.checkpoint_file, 'r') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint['columns'] != self.columns or \
+                checkpoint['params'] != self.params:
+            return None
+        if not os.path.isfile(self.partial_file) or \
+                os.path.getsize(self.partial_file) < checkpoint['size']:
+            return None
+
+        # Drop anything written after the last checkpoint.
+        with open(self.partial_file, 'r+b') as f:
+            f.truncate(checkpoint['size'])
+        self.size = checkpoint['size']
+        self.n_rows = checkpoint['rows']
+        if self.n_rows == 0:
+            return None
+        return read_feature_table(self.partial_file)
+
+    def write(self, filename, feature, signature=None):
+        self.pending.append((filename, np.ravel(feature), signature))
+        if len(self.pending) >= self.batch_size or \
+                time.time() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if len(self.pending) == 0 and self.size > 0:
+            return
+
+        filenames = [r[0] for r in self.pending]
+        features = np.zeros((len(self.pending), len(self.columns)))
+        for i, r in enumerate(self.pending):
+            features[i] = r[1]
+        signatures = None
+        if len(self.pending) > 0 and self.pending[0][2] is not None:
+            signatures = [r[2] for r in self.pending]
+        df = make_feature_table(filenames, features, self.columns, signatures)
+        df.index += self.n_rows
+
+        with open(self.partial_file, 'a' if self.size > 0 else 'w') as f:
+            df.to_csv(f, header=self.size == 0)
+            f.flush()
+            os.fsync(f.fileno())
+        self.size = os.path.getsize(self.partial_file)
+        self.n_rows += len(self.pending)
+        self.pending = []
+
+        checkpoint = {'columns': self.columns, 'params': self.params,
+                      'rows': self.n_rows, 'size': self.size}
+        tmp = self.checkpoint_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, self.checkpoint_file)
+
+    def finish(self, table=None):
+        """Write the collected rows, merged into table if given, to
+        table_file and remove the partial file and the checkpoint."""
+        self.flush()
+        df = read_feature_table(self.partial_file)
+        # A file that changed after it was written is written again.
+        df = df.drop_duplicates('filename', keep='last')
+        df = merge_feature_tables(table, df)
+        df.to_csv(self.table_file)
+        write_table_params(self.table_file, self.columns, self.params)
+        self.discard()
+        return df
+
+    def discard(self):
+        for fn in [self.partial_file, self.checkpoint_file]:
+            if os.path.isfile(fn):
+                os.remove(fn)
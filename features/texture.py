@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : texture.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import functools
+
+import cv2
+import numpy as np
+
+# Offsets (dy, dx) of the four 2D directions of mahotas.features.haralick.
+DIRECTIONS_2D = [(0, 1), (1, 1), (1, 0), (1, -1)]
+
+# The Haralick features were computed by mahotas on the grayscale image
+# turned to RGB, i.e. over the 13 3D directions of an image whose three
+# channels are equal. Every 3D direction then gives the co-occurrence
+# matrix of a 2D offset: each of the four 2D directions three times (within
+# a channel and across channels, both ways) and the zero offset once
+# (across channels). Only these five matrices are computed, with weights.
+DIRECTIONS_RGB = [((0, 1), 3), ((1, 1), 3), ((1, 0), 3), ((1, -1), 3),
+                  ((0, 0), 1)]
+
+# Number of co-occurrence matrices whose statistics are computed at a time.
+BATCH_SIZE = 64
+
+# Co-occurrences are counted for this many image rows at a time.
+COOCCURRENCE_ROWS = 1024
+
+# LBP codes are computed for this many image rows at a time.
+LBP_ROWS = 64
+
+
+def quantize(img, levels):
+    """Image with its gray levels reduced to levels, e.g. 32 or 64."""
+    n = np.iinfo(img.dtype).max + 1
+    if img.dtype == np.uint8:
+        lut = (np.arange(256) * levels // 256).astype(np.uint8)
+        return cv2.LUT(img, lut)
+    return (img.astype(np.int64) * levels // n).astype(np.intp)
+
+
+def direction_offsets(distance=1, mode='rgb'):
+    """(dy, dx) offsets at distance and their weights in the mean over the
+    directions; mode 'rgb' matches mahotas on the image turned to RGB, '2d'
+    matches mahotas on the grayscale image."""
+    if mode == 'rgb':
+        if distance >= 3:
+            # There are no pairs of channels this far apart.
+            raise ValueError('Haralick features of an RGB image need a '
+                             'distance below 3.')
+        return [((dy * distance, dx * distance), w)
+                for (dy, dx), w in DIRECTIONS_RGB]
+    elif mode == '2d':
+        return [((dy * distance, dx * distance), 1)
+                for dy, dx in DIRECTIONS_2D]
+    else:
+        raise ValueError('Unknown directions: {:s}'.format(mode))
+
+
+def _count_pairs(a, b, n_levels):
+    """Number of pixels with level i in a and level j in b, for all i, j."""
+    if a.dtype == np.uint8 and a.size < 2 ** 24:
+        # calcHist counts in float32, which is exact below 2^24.
+        return cv2.calcHist([a, b], [0, 1], None, [n_levels, n_levels],
+                            [0, n_levels, 0, n_levels]).astype(np.float64)
+    c = np.bincount((a.astype(np.intp) * n_levels + b).ravel(),
+                    minlength=n_levels * n_levels)
+    return c.reshape(n_levels, n_levels).astype(np.float64)
+
+
+def cooccurrence(img, dy, dx, n_levels):
+    """Symmetric co-occurrence matrix of the gray levels of img at the offset
+    (dy, dx), with dy >= 0, as counted by mahotas.
+
+    The pairs are counted COOCCURRENCE_ROWS rows at a time, so that an image
+    memory-mapped from disk is read strip by strip.
+    """
+    h, w = img.shape
+    if dy == 0 and dx == 0:
+        counts = np.zeros(n_levels, np.int64)
+        for y0 in range(0, h, COOCCURRENCE_ROWS):
+            counts += np.bincount(img[y0:y0 + COOCCURRENCE_ROWS].ravel(),
+                                  minlength=n_levels)
+        return np.diag(2 * counts.astype(np.float64))
+    c = np.zeros((n_levels, n_levels))
+    for y0 in range(0, h - dy, COOCCURRENCE_ROWS):
+        y1 = min(y0 + COOCCURRENCE_ROWS, h - dy)
+        c += _count_pairs(img[y0:y1, max(0, -dx):w - max(0, dx)],
+                          img[y0 + dy:y1 + dy, max(0, dx):w - max(0, -dx)],
+                          n_levels)
+    return c + c.T
+
+
+def _entropy(p, axis):
+    # Zero probabilities add nothing; p + (p == 0) keeps log2 finite.
+    return -(p * np.log2(p + (p == 0))).sum(axis=axis)
+
+
+def haralick_statistics(cmats):
+    """The 13 Haralick features of every co-occurrence matrix of the
+    (n, L, L) array cmats, as an (n, 13) array; the same formulas as
+    mahotas.features.haralick_features."""
+    cmats = np.asarray(cmats, np.float64)
+    n, L = cmats.shape[0], cmats.shape[1]
+    T = cmats.sum(axis=(1, 2))
+    if (T == 0).any():
+        raise ValueError('Cannot compute Haralick features of an empty '
+                         'co-occurrence matrix.')
+    p = cmats / T[:, None, None]
+    k = np.arange(L, dtype=np.float64)
+    k2 = k ** 2
+    tk = np.arange(2 * L, dtype=np.float64)
+    i, j = np.mgrid[:L, :L]
+
+    px = p.sum(axis=1)
+    py = p.sum(axis=2)
+    ux = px.dot(k)
+    uy = py.dot(k)
+    vx = px.dot(k2) - ux ** 2
+    vy = py.dot(k2) - uy ** 2
+    sx = np.sqrt(vx)
+    sy = np.sqrt(vy)
+
+    # Distributions of i + j and |i - j|, all matrices in one bincount.
+    flat = p.reshape(n, -1)
+    rows = np.arange(n)[:, None]
+    px_plus_y = np.bincount((rows * 2 * L + (i + j).ravel()).ravel(),
+                            flat.ravel(), n * 2 * L).reshape(n, 2 * L)
+    px_minus_y = np.bincount((rows * L + np.abs(i - j).ravel()).ravel(),
+                             flat.ravel(), n * L).reshape(n, L)
+
+    feats = np.empty((n, 13))
+    feats[:, 0] = (flat * flat).sum(axis=1)
+    feats[:, 1] = px_minus_y.dot(k2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = (flat.dot((i * j).ravel()) - ux * uy) / sx / sy
+    feats[:, 2] = np.where((sx == 0) | (sy == 0), 1., corr)
+    feats[:, 3] = vx
+    feats[:, 4] = flat.dot(1. / (1 + (i - j) ** 2).ravel())
+    feats[:, 5] = px_plus_y.dot(tk)
+    feats[:, 6] = px_plus_y.dot(tk ** 2) - feats[:, 5] ** 2
+    feats[:, 7] = _entropy(px_plus_y, 1)
+    feats[:, 8] = _entropy(flat, 1)
+    feats[:, 9] = px_minus_y.var(axis=1)
+    feats[:, 10] = _entropy(px_minus_y, 1)
+
+    hx = _entropy(px, 1)
+    hy = _entropy(py, 1)
+    cross = px[:, :, None] * py[:, None, :]
+    cross += cross == 0
+    hxy1 = -(p * np.log2(cross)).sum(axis=(1, 2))
+    hxy2 = _entropy(cross, (1, 2))
+    hmax = np.maximum(hx, hy)
+    feats[:, 11] = (feats[:, 8] - hxy1) / np.where(hmax == 0, 1., hmax)
+    feats[:, 12] = np.sqrt(np.maximum(0, 1 - np.exp(-2. * (hxy2 -
+                                                           feats[:, 8]))))
+    return feats
+
+
+def haralick_batch(images, distance=1, levels=None, directions='rgb'):
+    """Mean Haralick features over the directions of every 2D grayscale
+    image of images, as an (m, 13) array.
+
+    By default the co-occurrence matrices have img.max() + 1 gray levels
+    and the features are those of mahotas.features.haralick on the image
+    turned to RGB, with return_mean=True, as computed by earlier versions
+    (directions='2d' gives those of mahotas on the grayscale image). With
+    levels, the gray levels are first reduced to levels, which makes the
+    matrices smaller and the statistics faster, but changes the features.
+    The statistics of all matrices of the same size are computed together.
+    """
+    offsets = direction_offsets(distance, directions)
+    weights = np.array([w for _, w in offsets], np.float64)
+    weights /= weights.sum()
+
+    # Co-occurrence matrices of all images, grouped by their size.
+    groups = {}
+    for index, img in enumerate(images):
+        img = np.asarray(img)
+        if img.ndim != 2:
+            raise ValueError('Haralick features need a 2D grayscale image.')
+        if levels is not None:
+            img = quantize(img, levels)
+            n_levels = levels
+        else:
+            n_levels = int(img.max()) + 1 if img.size > 0 else 1
+        cmats = [cooccurrence(img, dy, dx, n_levels)
+                 for (dy, dx), _ in offsets]
+        groups.setdefault(n_levels, []).append((index, cmats))
+
+    features = np.zeros((sum(len(g) for g in groups.values()), 13))
+    n_dirs = len(offsets)
+    for group in groups.values():
+        per_batch = max(1, BATCH_SIZE // n_dirs)
+        for start in range(0, len(group), per_batch):
+            batch = group[start:start + per_batch]
+            f = haralick_statistics([c for _, cmats in batch for c in cmats])
+            f = f.reshape(len(batch), n_dirs, 13)
+            for (index, _), fi in zip(batch, f):
+                features[index] = weights.dot(fi)
+    return features
+
+
+def haralick(img, distance=1, levels=None, directions='rgb'):
+    """Mean Haralick features of a 2D grayscale image, see
+    haralick_batch."""
+    return haralick_batch([img], distance, levels, directions)[0]
+
+
+def lbp_bins(codes, P, method='default'):
+    """Histogram bin (0 to P + 1) of every LBP code of P points, or -1 for
+    codes outside of the histogram.
+
+    method 'default' counts the codes of skimage.feature.local_binary_pattern
+    with its default method as np.histogram(codes, bins=P + 2,
+    range=(0, P + 2)) does, as in earlier versions: codes up to P in their
+    own bin, P + 1 and P + 2 in the last one. method 'uniform' gives the
+    codes of its 'uniform' method: the number of set bits of codes with at
+    most two changes between neighbouring bits (not wrapping around), P + 1
+    for the others.
+    """
+    codes = np.asarray(codes, np.int64)
+    if method == 'default':
+        return np.where(codes <= P + 2, np.minimum(codes, P + 1), -1)
+    elif method == 'uniform':
+        bits = (codes[..., None] >> np.arange(P)) & 1
+        changes = (bits[..., 1:] != bits[..., :-1]).sum(axis=-1)
+        return np.where(changes <= 2, bits.sum(axis=-1), P + 1)
+    else:
+        raise ValueError('Unknown LBP method: {:s}'.format(method))
+
+
+@functools.lru_cache(maxsize=None)
+def lbp_lookup_table(P, method='default'):
+    """lbp_bins of all 2^P codes."""
+    return lbp_bins(np.arange(2 ** P), P, method)
+
+
+def _circle(P, R):
+    """Row and column offsets of the P points at radius R, rounded to 5
+    decimals like skimage does."""
+    angles = 2 * np.pi * np.arange(P, dtype=np.float64) / P
+    return np.round(-R * np.sin(angles), 5), np.round(R * np.cos(angles), 5)
+
+
+def lbp_histograms(img, scales=((10, 5),), method='default'):
+    """Normalized LBP histograms (P + 2 bins) of a 2D grayscale image for
+    every (P, R) of scales, equal to np.histogram(local_binary_pattern(img,
+    P, R, method), bins=P + 2, range=(0, P + 2), density=True).
+
+    All scales are computed in one pass over the image, LBP_ROWS rows at a
+    time. The points of the circles are interpolated from shifted views of
+    the zero padded strip with the same arithmetic as skimage, so the
+    comparisons with the center are the same. The codes of every strip are
+    counted, and the counts are mapped to the histogram bins through
+    lbp_lookup_table, so neither the LBP image nor a float64 or padded copy
+    of the image is made, and an image memory-mapped from disk is read strip
+    by strip.
+    """
+    h, w = img.shape
+    circles = [_circle(P, R) for P, R in scales]
+    pad = int(np.ceil(max([np.abs(np.concatenate(c)).max()
+                           for c in circles] + [0]))) + 1
+
+    def padded(start, stop):
+        # Rows start to stop of the image padded by pad zeros on each side.
+        stop = min(stop, h + 2 * pad)
+        block = np.zeros((stop - start, w + 2 * pad))
+        r0, r1 = max(start - pad, 0), min(stop - pad, h)
+        block[r0 + pad - start:r1 + pad - start, pad:pad + w] = img[r0:r1]
+        return block
+
+    rows = np.arange(h, dtype=np.float64)[:, None]
+    cols = np.arange(w, dtype=np.float64)[None, :]
+
+    # skimage interpolates at (r + rp, c + cp), so the interpolation weights
+    # depend on the row and the column: dr and dc are those of every row and
+    # column (None where they are zero), r0 and c0 the offsets of the top
+    # left pixel in the padded image.
+    def weights(offset, positions):
+        d = (positions + offset) - np.floor(positions + offset)
+        return int(np.floor(offset)) + pad, d if d.any() else None
+
+    points = [[(weights(y, rows), weights(x, cols)) for y, x in zip(*c)]
+              for c in circles]
+
+    counts = [np.zeros(2 ** P if P <= 16 else 0, np.int64)
+              for P, _ in scales]
+    others = [[] for _ in scales]
+    for y0 in range(0, h, LBP_ROWS):
+        y1 = min(y0 + LBP_ROWS, h)
+        n = y1 - y0
+        block = padded(y0, y1 + 2 * pad + 1)
+        center = block[pad:pad + n, pad:pad + w]
+
+        # Interpolate along the rows first, once for all points with the
+        # same column offset, e.g. points mirrored about the vertical axis,
+        # then between two rows; the same operations as skimage.
+        columns = {}
+        for pts in points:
+            for _, (c0, dc) in pts:
+                key = (c0, None if dc is None else dc.tobytes())
+                if key not in columns:
+                    left = block[:, c0:c0 + w]
+                    columns[key] = left if dc is None else \
+                        (1 - dc) * left + dc * block[:, c0 + 1:c0 + 1 + w]
+
+        for s, (P, _) in enumerate(scales):
+            codes = np.zeros((n, w), np.uint32)
+            for i, ((r0, dr), (c0, dc)) in enumerate(points[s]):
+                col = columns[(c0, None if dc is None else dc.tobytes())]
+                top = col[r0:r0 + n]
+                if dr is not None:
+                    d = dr[y0:y1]
+                    top = (1 - d) * top + d * col[r0 + 1:r0 + 1 + n]
+                codes |= (top >= center).astype(np.uint32) << np.uint32(i)
+            if P <= 16:
+                counts[s] += np.bincount(codes.ravel(), minlength=2 ** P)
+            else:
+                others[s].append(np.unique(codes, return_counts=True))
+
+    histograms = []
+    for s, (P, _) in enumerate(scales):
+        if P <= 16:
+            bins = lbp_lookup_table(P, method)
+            n = counts[s]
+        else:
+            codes = np.concatenate([c for c, _ in others[s]])
+            n = np.concatenate([k for _, k in others[s]])
+            bins = lbp_bins(codes, P, method)
+        keep = bins >= 0
+        hist = np.bincount(bins[keep], n[keep], P + 2)
+        histograms.append(hist / hist.sum())
+    return histograms
+
+
+def lbp(img, P=10, R=5, method='default'):
+    """Normalized LBP histogram of a 2D grayscale image, see
+    lbp_histograms."""
+    return lbp_histograms(img, [(P, R)], method)[0]
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : tiling.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from features.core import (Workspace, phase_masks, threshold_from_histogram,
+                           shape_statistics)
+from features.denoise import DOWNSAMPLE_FACTOR, denoise as denoise_image
+
+# Connected regions of one phase of a tiled segmentation, merged across
+# tile borders: area, bounding box and centroid of every region.
+Regions = namedtuple('Regions', ['area', 'left', 'top', 'width', 'height',
+                                 'x', 'y'])
+
+# Result of segment_tiled(): the threshold between the two intensity
+# clusters, the area features, the spatial features (None if they were not
+# computed) and the regions of both phases.
+TiledSegmentation = namedtuple('TiledSegmentation', ['threshold', 'area',
+                                                     'spatial', 'regions2',
+                                                     'regions3'])
+
+
+def filter_radius(d, denoise='bilateral'):
+    """Distance in pixels over which a denoising filter reads its input."""
+    if denoise == 'bilateral':
+        return d // 2
+    elif denoise == 'guided':
+        # Two box filters of diameter d.
+        return 2 * (d // 2)
+    elif denoise == 'downsampled':
+        return DOWNSAMPLE_FACTOR * (d // DOWNSAMPLE_FACTOR // 2 + 2)
+    else:
+        raise ValueError('Unknown denoising method: {:s}'.format(denoise))
+
+
+def morphology_radius(ksize0=9, ksize1=9, ksize2=9, ksize3=3):
+    """Distance in pixels over which phase_masks reads its input; every
+    opening or closing is an erosion and a dilation."""
+    return max(2 * (ksize0 // 2 + ksize1 // 2),
+               2 * (ksize2 // 2 + ksize3 // 2))
+
+
+def tiles(shape, tile_size, halo):
+    """(core, region) slices of the tiles covering an image of the given
+    shape, row by row. core is the part of the image a tile is responsible
+    for; region is core grown by halo pixels, clipped to the image."""
+    height, width = shape[:2]
+    for y0 in range(0, height, tile_size):
+        y1 = min(y0 + tile_size, height)
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            core = (slice(y0, y1), slice(x0, x1))
+            region = (slice(max(0, y0 - halo), min(height, y1 + halo)),
+                      slice(max(0, x0 - halo), min(width, x1 + halo)))
+            yield core, region
+
+
+def _inner(core, region):
+    """Slices of core relative to region."""
+    return tuple(slice(c.start - r.start, c.stop - r.start)
+                 for c, r in zip(core, region))
+
+
+def _touching(a, b):
+    """Pairs of labels of 8-connected pixels on either side of a seam, where
+    a and b are the labels (-1 for background) of the pixels along it."""
+    pairs = []
+    for u, v in [(a, b), (a[1:], b[:-1]), (a[:-1], b[1:])]:
+        both = (u >= 0) & (v >= 0)
+        pairs.append(np.stack([u[both], v[both]], axis=1))
+    return np.concatenate(pairs)
+
+
+class _RegionTable(object):
+    """Connected regions of one phase collected tile by tile.
+
+    Components of every tile get global ids; components touching across a
+    seam are joined with a union-find over the ids once all tiles are in.
+    """
+
+    def __init__(self, width):
+        self.n = 0
+        self.columns = {k: [] for k in ['area', 'left', 'top', 'right',
+                                        'bottom', 'sx', 'sy']}
+        self.pairs = []
+        # Labels along the bottom of the previous row of tiles and along
+        # the top of the current one, and along the right of the last tile.
+        self.prev_bottom = None
+        self.top = np.full(width, -1, np.int64)
+        self.bottom = np.full(width, -1, np.int64)
+        self.right = None
+
+    def add(self, mask, x0, y0, first_in_row, workspace):
+        """Add the components of the phase image mask (phase pixels are 0)
+        whose top left corner is at (x0, y0) in the full image."""
+        inv = cv2.bitwise_not(mask, dst=workspace.get('inv', mask.shape))
+        labels = workspace.get('labels', mask.shape, np.int32)
+        n, labels, stats, centroids = cv2.connectedComponentsWithStats(
+            inv, labels, connectivity=8, ltype=cv2.CV_32S)
+        area = stats[1:, 4].astype(np.int64)
+        c = self.columns
+        c['area'].append(area)
+        c['left'].append(stats[1:, 0] + x0)
+        c['top'].append(stats[1:, 1] + y0)
+        c['right'].append(stats[1:, 0] + stats[1:, 2] - 1 + x0)
+        c['bottom'].append(stats[1:, 1] + stats[1:, 3] - 1 + y0)
+        c['sx'].append((centroids[1:, 0] + x0) * area)
+        c['sy'].append((centroids[1:, 1] + y0) * area)
+
+        # Global ids of the labels along the tile borders; 0 (background)
+        # becomes -1.
+        ids = lambda l: np.where(l > 0, l.astype(np.int64) + self.n - 1, -1)
+        left = ids(labels[:, 0])
+        if not first_in_row:
+            self.pairs.append(_touching(self.right, left))
+        self.right = ids(labels[:, -1])
+        self.top[x0:x0 + mask.shape[1]] = ids(labels[0])
+        self.bottom[x0:x0 + mask.shape[1]] = ids(labels[-1])
+        self.n += n - 1
+
+    def end_row(self):
+        if self.prev_bottom is not None:
+            self.pairs.append(_touching(self.prev_bottom, self.top))
+        self.prev_bottom = self.bottom.copy()
+
+    def regions(self):
+        c = {k: np.concatenate(v) if len(v) > 0 else np.zeros(0)
+             for k, v in self.columns.items()}
+        parent = np.arange(self.n)
+        if len(self.pairs) > 0:
+            pairs = np.unique(np.concatenate(self.pairs), axis=0)
+        else:
+            pairs = np.zeros((0, 2), np.int64)
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in pairs:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+        # Every id points to a smaller one, so one pass in order resolves
+        # the roots.
+        for i in range(self.n):
+            parent[i] = parent[parent[i]]
+
+        roots, index = np.unique(parent, return_inverse=True)
+        m = len(roots)
+        area = np.bincount(index, c['area'], m)
+        left = np.full(m, np.inf)
+        top = np.full(m, np.inf)
+        right = np.full(m, -np.inf)
+        bottom = np.full(m, -np.inf)
+        np.minimum.at(left, index, c['left'])
+        np.minimum.at(top, index, c['top'])
+        np.maximum.at(right, index, c['right'])
+        np.maximum.at(bottom, index, c['bottom'])
+        return Regions(area, left, top, right - left + 1, bottom - top + 1,
+                       np.bincount(index, c['sx'], m) / area,
+                       np.bincount(index, c['sy'], m) / area)
+
+
+def segment_tiled(img, tile_size=1024, d=15, sigma_color=75, sigma_space=75,
+                  ksize0=9, ksize1=9, ksize2=9, ksize3=3,
+                  clustering='histogram', denoise='bilateral', spatial=True,
+                  p2_out=None, p3_out=None):
+    """Segment an image tile by tile, with memory bounded by tile_size.
+
+    img is any 2D 8-bit array that can be sliced, e.g. a numpy.memmap, and
+    is only read one tile at a time. Every tile is read with a halo wide
+    enough for the filter and the morphology (see filter_radius and
+    morphology_radius), so the phase images are the same as those of
+    features.core.segment on the whole image; the 'downsampled' filter is
+    only approximately the same near tile borders.
+
+    The image is read twice: the filtered tiles are first reduced to a
+    histogram, from which the global threshold is computed, then segmented.
+    Area fractions are summed exactly over the tiles, and connected regions
+    that touch across tile borders are merged before computing the spatial
+    features. The phase images are written to p2_out and p3_out if given.
+    """
+    if clustering != 'histogram':
+        raise ValueError('Tiled segmentation needs the histogram clustering.')
+    shape = img.shape[:2]
+    r_filter = filter_radius(d, denoise)
+    halo = r_filter + morphology_radius(ksize0, ksize1, ksize2, ksize3)
+    # Keep tile origins on even pixels for the 'downsampled' filter.
+    halo += halo % 2
+    tile_size += tile_size % 2
+    ws = Workspace()
+
+    # Histogram of the filtered image.
+    h = np.zeros(256, np.int64)
+    for core, region in tiles(shape, tile_size, r_filter + r_filter % 2):
+        tile = np.ascontiguousarray(img[region])
+        filtered = ws.get('filtered', tile.shape)
+        denoise_image(tile, d, sigma_color, sigma_space, denoise, dst=filtered)
+        h += np.bincount(filtered[_inner(core, region)].ravel(),
+                         minlength=256)
+    t = threshold_from_histogram(h)
+
+    n_phase2 = n_phase3 = 0
+    table2 = _RegionTable(shape[1])
+    table3 = _RegionTable(shape[1])
+    for core, region in tiles(shape, tile_size, halo):
+        tile = np.ascontiguousarray(img[region])
+        filtered = ws.get('filtered', tile.shape)
+        denoise_image(tile, d, sigma_color, sigma_space, denoise, dst=filtered)
+        p2, p3 = phase_masks(filtered, t, ksize0, ksize1, ksize2, ksize3,
+                             workspace=ws)
+        inner = _inner(core, region)
+        p2 = np.ascontiguousarray(p2[inner])
+        p3 = np.ascontiguousarray(p3[inner])
+        if p2_out is not None:
+            p2_out[core] = p2
+        if p3_out is not None:
+            p3_out[core] = p3
+
+        n_phase2 += p2.size - cv2.countNonZero(p2)
+        n_phase3 += p3.size - cv2.countNonZero(p3)
+        if spatial:
+            first = core[1].start == 0
+            table2.add(p2, core[1].start, core[0].start, first, ws)
+            table3.add(p3, core[1].start, core[0].start, first, ws)
+            if core[1].stop == shape[1]:
+                table2.end_row()
+                table3.end_row()
+
+    n = shape[0] * shape[1]
+    area = np.asarray([1 - n_phase2 / n - n_phase3 / n, n_phase2 / n,
+                       n_phase3 / n])
+    regions2 = regions3 = spatial_features = None
+    if spatial:
+        regions2 = table2.regions()
+        regions3 = table3.regions()
+        spatial_features = []
+        for r in [regions2, regions3]:
+            spatial_features += shape_statistics(r.area, r.width, r.height,
+                                                 r.x, r.y)
+    return TiledSegmentation(t, area, spatial_features, regions2, regions3)
@@ -8,7 +8,11 @@ import os
 import pandas as pd
 from PyQt5.QtCore import pyqtSignal, QThread
 
-from features import *
+from imageFeatures import *
+from features.features import feature_columns
+from features.parallel import imap_images
+from features.store import save_feature_table
+from features.table import FeatureTableWriter, read_feature_table, read_table_params, stale_filenames
 
 
 class FeatureCollectionThread(QThread):
@@ -18,7 +22,7 @@ class FeatureCollectionThread(QThread):
     complete_signal = pyqtSignal()
 
     def __init__(self, filenames, collectAreaFeatures, collectSpatialFeatures, collectHaralickFeatures,
-                 collectLBPFeatures, outputFilename, params):
+                 collectLBPFeatures, outputFilename, params, cacheDir=None, incremental=False, binaryOutput=False):
         QThread.__init__(self)
         self.filenames = filenames
         self.collectAreaFeatures = collectAreaFeatures
@@ -36,6 +40,13 @@ class FeatureCollectionThread(QThread):
         self.ksize1 = params['ksize1']
         self.ksize2 = params['ksize2']
         self.ksize3 = params['ksize3']
+        self.clustering = params['clustering'] if 'clustering' in params else 'histogram'
+        self.denoise = params['denoise'] if 'denoise' in params else 'bilateral'
+        self.level = params['level'] if 'level' in params else 0
+        self.n_workers = params['n_workers'] if 'n_workers' in params else 1
+        self.cache = FeatureCache(cacheDir) if cacheDir is not None else None
+        self.incremental = incremental
+        self.binaryOutput = binaryOutput
 
         self.features = None
 
@@ -44,59 +55,95 @@ class FeatureCollectionThread(QThread):
     def __del__(self):
         self.wait()
 
-    def save_features(self, features):
-        columns = []
-        if self.collectAreaFeatures:
-            for i in range(3):
-                columns.append('area_{:d}'.format(i))
-        if self.collectSpatialFeatures:
-            for i in range(14):
-                columns.append('spatial_{:d}'.format(i))
-        if self.collectHaralickFeatures:
-            for i in range(13):
-                columns.append('haralick_{:d}'.format(i))
-        if self.collectLBPFeatures:
-            for i in range(12):
-                columns.append('lbp_{:d}'.format(i))
-        df = pd.DataFrame(data=features, columns=columns)
-
-        basenames = [os.path.basename(x) for x in self.filenames]
-        df.insert(0, 'filename', value=basenames)
-
-        df.to_csv(self.outputFilename)
+    def feature_columns(self):
+        feature_names = [fn for fn, active in zip(['area', 'spatial', 'haralick', 'lbp'],
+                                                  [self.collectAreaFeatures, self.collectSpatialFeatures,
+                                                   self.collectHaralickFeatures, self.collectLBPFeatures]) if active]
+        return feature_columns(feature_names, self.P)
+
+    def load_table(self):
+        """Existing feature table to update in incremental mode, if any."""
+        if not self.incremental or not os.path.isfile(self.outputFilename):
+            return None
+        table = read_feature_table(self.outputFilename)
+        if [c for c in table.columns if c not in ['filename', 'signature']] != self.feature_columns():
+            self.output_signal.emit('Features in {:s} differ from the selected features; rebuilding it.'
+                                    .format(self.outputFilename))
+            return None
+        if read_table_params(self.outputFilename) != {'columns': self.feature_columns(),
+                                                      'params': self.checkpoint_params()}:
+            self.output_signal.emit('Feature params of {:s} differ from the selected params; rebuilding it.'
+                                    .format(self.outputFilename))
+            return None
+        return table
+
+    def checkpoint_params(self):
+        """Parameters a resumed run must share with the interrupted one."""
+        return {'distance': self.distance, 'P': self.P, 'R': self.R, 'd': self.d, 'sigma_color': self.sigma_color,
+                'sigma_space': self.sigma_space, 'ksize0': self.ksize0, 'ksize1': self.ksize1,
+                'ksize2': self.ksize2, 'ksize3': self.ksize3, 'clustering': self.clustering,
+                'denoise': self.denoise, 'level': self.level}
 
     def run(self):
         self.running = True
 
         self.output_signal.emit('Feature collection thread ready.')
 
-        features = None
-        for i, fname in enumerate(self.filenames):
+        # In incremental mode only images that are new or changed since the table was written are processed.
+        table = self.load_table()
+        errors = []
+        stale, signatures = stale_filenames(table, self.filenames, errors=errors)
+        for fname, error in errors:
+            self.output_signal.emit('Failed to read {:s}: {:s}'.format(fname, error))
+        if table is not None:
+            self.output_signal.emit('{:d} of {:d} images are new or changed.'.format(len(stale), len(self.filenames)))
+
+        # Rows are streamed to disk in batches. A run that was stopped or crashed resumes after the last image it
+        # wrote.
+        writer = FeatureTableWriter(self.outputFilename, self.feature_columns(), params=self.checkpoint_params())
+        done = writer.resume()
+        if done is not None:
+            stale, _ = stale_filenames(done, stale)
+            self.output_signal.emit('Resuming: {:d} images were collected by the previous run.'.format(len(done)))
+        # Unreadable files count as done, like the images that fail below.
+        for i in range(len(self.filenames) - len(stale)):
+            self.incremental_signal.emit()
+
+        n_collected = 0
+        results = imap_images(collect_features_from_file, stale, n_workers=self.n_workers,
+                              collectAreaFeatures=self.collectAreaFeatures,
+                              collectSpatialFeatures=self.collectSpatialFeatures,
+                              collectHaralickFeatures=self.collectHaralickFeatures,
+                              collectLBPFeatures=self.collectLBPFeatures,
+                              distance=self.distance, P=self.P, R=self.R, d=self.d, sigma_color=self.sigma_color,
+                              sigma_space=self.sigma_space, ksize0=self.ksize0, ksize1=self.ksize1,
+                              ksize2=self.ksize2, ksize3=self.ksize3, clustering=self.clustering,
+                              denoise=self.denoise, level=self.level, cache=self.cache)
+        for fname, f, error in results:
             if not self.running:
+                results.close()
+                writer.flush()
                 return None
-            img = cv2.imread(fname)
-            if img is None:
+            if error is not None:
                 self.incremental_signal.emit()
-                self.output_signal.emit('Failed to load image: {:s}'.format(fname))
+                self.output_signal.emit('Failed to collect features from {:s}: {:s}'.format(fname, error))
                 continue
-            f = collect_features(img, self.collectAreaFeatures, self.collectSpatialFeatures,
-                                 self.collectHaralickFeatures, self.collectLBPFeatures,
-                                 distance=self.distance, P=self.P, R=self.R, d=self.d, sigma_color=self.sigma_color,
-                                 sigma_space=self.sigma_space, ksize0=self.ksize0, ksize1=self.ksize1,
-                                 ksize2=self.ksize2, ksize3=self.ksize3)
-            if features is None:
-                features = f
-            else:
-                features = np.vstack((features, f))
+            writer.write(fname, f, signatures[fname])
+            n_collected += 1
 
             self.incremental_signal.emit()
             # self.output_signal.emit('Complete one.')
 
         if self.running:
-            self.save_features(features)
-
-            self.output_signal.emit('Completed! Collected features of shape {} exported to {:s}.'
-                                    .format(features.shape, self.outputFilename))
+            df = writer.finish(table)
+            if self.binaryOutput:
+                binaryFilename = os.path.splitext(self.outputFilename)[0] + '.npz'
+                save_feature_table(df, binaryFilename)
+                self.output_signal.emit('Binary feature table saved to {:s}.'.format(binaryFilename))
+
+            self.output_signal.emit('Completed! Collected features of {:d} images; features of shape {} exported '
+                                    'to {:s}.'.format(n_collected, df[self.feature_columns()].shape,
+                                                      self.outputFilename))
             self.incremental_signal.emit()
             self.complete_signal.emit()
 
@@ -15,7 +15,10 @@ from PyQt5.QtGui import QIcon, QDesktopServices
 from PyQt5.QtCore import QSize, QUrl
 
 from featureCollectionThread import FeatureCollectionThread
+from imageFeatures import CACHE_DIR
 from paramDialog import ParamDialog
+from sweepThread import SweepThread
+from features.sweep import parameter_grid, parse_grid
 
 
 class FeatureDialog(QDialog, QMainWindow):
@@ -67,6 +70,10 @@ class FeatureDialog(QDialog, QMainWindow):
         self.params['ksize1'] = 9
         self.params['ksize2'] = 9
         self.params['ksize3'] = 3
+        self.params['n_workers'] = 1
+        self.params['clustering'] = 'histogram'
+        self.params['denoise'] = 'bilateral'
+        self.params['level'] = 0
 
     def createConfigGroup(self):
         self.configGroup = QGroupBox('Configuration')
@@ -81,7 +88,7 @@ class FeatureDialog(QDialog, QMainWindow):
 
         self.filenamePatternEdit = QLineEdit()
         grid.addWidget(QLabel('Image filename pattern:'), 1, 0)
-        self.filenamePatternEdit.setPlaceholderText('*.tiff *.png')
+        self.filenamePatternEdit.setPlaceholderText('*.tif *.tiff *.png')
         grid.addWidget(self.filenamePatternEdit, 1, 1, 1, 2)
         self.filenamePatternEdit.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
 
@@ -105,6 +112,14 @@ class FeatureDialog(QDialog, QMainWindow):
         grid.addWidget(self.outputPathEdit, 3, 1)
         grid.addWidget(self.loadOutputPathBtn, 3, 2)
 
+        self.sweepEdit = QLineEdit()
+        self.sweepEdit.setPlaceholderText('e.g. d=9,15; ksize0=7,9,11; P=8,10')
+        self.sweepEdit.setToolTip('Values of the parameters to sweep, used with "Parameter sweep"; other parameters '
+                                  'keep their settings.')
+        grid.addWidget(QLabel('Sweep grid:'), 4, 0)
+        grid.addWidget(self.sweepEdit, 4, 1, 1, 2)
+        self.sweepEdit.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+
         grid.setColumnStretch(0, 10)
         grid.setColumnStretch(1, 20)
         grid.setColumnStretch(2, 2)
@@ -125,6 +140,25 @@ class FeatureDialog(QDialog, QMainWindow):
         for i in range(4):
             vbox.addWidget(self.featureCheckBoxes[i])
 
+        self.cacheCheckBox = QCheckBox('Use feature cache')
+        self.cacheCheckBox.setToolTip('Reuse features of images already processed with the same parameters.')
+        self.cacheCheckBox.setChecked(True)
+        vbox.addWidget(self.cacheCheckBox)
+
+        self.incrementalCheckBox = QCheckBox('Incremental update')
+        self.incrementalCheckBox.setToolTip('Only collect features of new or changed images and merge them into the '
+                                            'existing output file.')
+        vbox.addWidget(self.incrementalCheckBox)
+
+        self.binaryCheckBox = QCheckBox('Also save as .npz')
+        self.binaryCheckBox.setToolTip('Save a binary copy of the feature table that loads much faster than csv.')
+        vbox.addWidget(self.binaryCheckBox)
+
+        self.sweepCheckBox = QCheckBox('Parameter sweep')
+        self.sweepCheckBox.setToolTip('Collect features for every combination of the sweep grid; stages shared by '
+                                      'several settings run once per image.')
+        vbox.addWidget(self.sweepCheckBox)
+
         vbox.addStretch(1)
 
         self.featureGroup.setLayout(vbox)
@@ -160,7 +194,7 @@ class FeatureDialog(QDialog, QMainWindow):
         vbox.addWidget(self.startBtn)
 
         self.stopBtn = QPushButton('Stop')
-        self.stopBtn.setToolTip('Stop feature collection. Collected features would not be saved.')
+        self.stopBtn.setToolTip('Stop feature collection. Collected features are kept and the next run resumes from them.')
         self.stopBtn.clicked.connect(self.stop)
         self.stopBtn.setEnabled(False)
         vbox.addWidget(self.stopBtn)
@@ -244,12 +278,18 @@ class FeatureDialog(QDialog, QMainWindow):
         if self.outputPrefix == "":
             self.outputPrefix = "feature-collection-" + str(date.today())
         if self.filenamePattern == "":
-            self.filenamePattern = "*.tiff *.png"
+            self.filenamePattern = "*.tif *.tiff *.png"
 
         for i in range(4):
             self.featuresActive[i] = self.featureCheckBoxes[i].isChecked()
 
         ready, msg = self.validate()
+        settings = None
+        if ready and self.sweepCheckBox.isChecked():
+            try:
+                settings = parameter_grid(parse_grid(self.sweepEdit.text()), self.params)
+            except ValueError as e:
+                ready, msg = False, 'Error: Invalid sweep grid: {}'.format(e)
         if not ready:
             QMessageBox.critical(self, 'Error!', msg, QMessageBox.Ok)
             self.output(msg)
@@ -282,14 +322,32 @@ class FeatureDialog(QDialog, QMainWindow):
         self.output('{:d} image files found.'.format(len(filenames)))
         self.incrementProgressBar()
 
-        outputFilename = self.outputPrefix + '_' + str(len(filenames)) + '_'
+        # The output of an incremental update is kept under the same name as the image directory grows.
+        if self.incrementalCheckBox.isChecked():
+            outputFilename = self.outputPrefix + '_'
+        else:
+            outputFilename = self.outputPrefix + '_' + str(len(filenames)) + '_'
         for i in range(len(self.featuresActive)):
             outputFilename += '1' if self.featuresActive[i] else '0'
+
+        if settings is not None:
+            featureNames = [fn for fn, active in zip(['area', 'spatial', 'haralick', 'lbp'], self.featuresActive)
+                            if active]
+            self.collectionThread = SweepThread(filenames, featureNames, settings,
+                                                os.path.join(self.outputPath, outputFilename + '_sweep'),
+                                                n_workers=self.params['n_workers'])
+            self.collectionThread.incremental_signal.connect(self.incrementProgressBar)
+            self.collectionThread.output_signal.connect(self.output)
+            self.collectionThread.complete_signal.connect(self.completed)
+            self.collectionThread.start()
+            return None
+
         outputFilename = os.path.join(self.outputPath, outputFilename+'.csv')
 
         self.collectionThread = FeatureCollectionThread(
             filenames, self.featuresActive[0], self.featuresActive[1], self.featuresActive[2], self.featuresActive[3],
-            outputFilename, self.params
+            outputFilename, self.params, cacheDir=CACHE_DIR if self.cacheCheckBox.isChecked() else None,
+            incremental=self.incrementalCheckBox.isChecked(), binaryOutput=self.binaryCheckBox.isChecked()
         )
         self.collectionThread.incremental_signal.connect(self.incrementProgressBar)
         self.collectionThread.output_signal.connect(self.output)
@@ -340,5 +398,9 @@ class FeatureDialog(QDialog, QMainWindow):
         self.params['ksize1'] = params['ksize1']
         self.params['ksize2'] = params['ksize2']
         self.params['ksize3'] = params['ksize3']
+        self.params['n_workers'] = params['n_workers']
+        self.params['clustering'] = params['clustering']
+        self.params['denoise'] = params['denoise']
+        self.params['level'] = params['level']
 
         self.output('Parameters updated.')
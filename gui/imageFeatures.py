@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename: imageFeatures.py
+# @Date: 2020-06-21
+# @Author: Wufei Ma
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+import mahotas.features
+
+# Share the feature extraction engine of the command line tools (../features).
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features.cache import FeatureCache, file_digest
+from features.core import Workspace, segment, area_statistics, spatial_statistics
+from features.imagesource import read_image, crop_rows, crop_image
+from features.texture import haralick, lbp
+
+# Scratch buffers of the segmentation, reused by every image this process collects features from.
+_workspace = Workspace()
+
+# Default location of the on-disk feature cache.
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'microstructure-characterization', 'features')
+
+# Feature params of collect_features and their defaults, which make up the cache keys.
+CACHE_KEY_DEFAULTS = {'distance': 1, 'P': 10, 'R': 5, 'd': 15, 'sigma_color': 75, 'sigma_space': 75,
+                      'ksize0': 9, 'ksize1': 9, 'ksize2': 9, 'ksize3': 3, 'clustering': 'histogram',
+                      'denoise': 'bilateral', 'level': 0}
+
+
+def segmentation_feature(img, collectAreaFeatures, collectSpatialFeatures, d, sigma_color, sigma_space,
+                         ksize0, ksize1, ksize2, ksize3, clustering='histogram', denoise='bilateral', level=0):
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    seg = segment(img, d, sigma_color, sigma_space, ksize0, ksize1, ksize2, ksize3, clustering=clustering,
+                  denoise=denoise, level=level, components=collectSpatialFeatures,
+                  workspace=_workspace)
+
+    area_features = np.expand_dims(area_statistics(seg), 0)
+    if collectSpatialFeatures:
+        spatial_features = np.expand_dims(np.array(spatial_statistics(seg)), 0)
+
+    if collectAreaFeatures and collectSpatialFeatures:
+        return np.hstack((area_features, spatial_features))
+    elif collectAreaFeatures:
+        return area_features
+    elif collectSpatialFeatures:
+        return spatial_features
+    else:
+        return None
+
+
+def haralick_feature(img, distance):
+    if img is None:
+        return np.zeros((1, 13))
+    if np.array_equal(img[:, :, 0], img[:, :, 1]) and np.array_equal(img[:, :, 0], img[:, :, 2]):
+        # A grayscale image read as color: the channels are equal, see features.texture.
+        h = haralick(img[:, :, 0], distance)
+    else:
+        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        h = mahotas.features.haralick(img_rgb, distance=distance, return_mean=True, ignore_zeros=False)
+    return np.expand_dims(h, 0)
+
+
+def lbp_feature(img, P, R):
+    if img is None:
+        return np.zeros((1, 12))
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return np.expand_dims(lbp(img_gray, P, R), 0)
+
+
+def collect_features(img, collectAreaFeatures, collectSpatialFeatures, collectHaralickFeatures, collectLBPFeatures,
+                     distance=1, P=10, R=5, d=15, sigma_color=75, sigma_space=75,
+                     ksize0=9, ksize1=9, ksize2=9, ksize3=3, clustering='histogram', denoise='bilateral', level=0,
+                     crop=True):
+    if crop:
+        img = crop_image(img)
+
+    features = None
+
+    if collectAreaFeatures or collectSpatialFeatures:
+        f = segmentation_feature(img, collectAreaFeatures, collectSpatialFeatures, d=d, sigma_color=sigma_color,
+                                 sigma_space=sigma_space, ksize0=ksize0, ksize1=ksize1, ksize2=ksize2, ksize3=ksize3,
+                                 clustering=clustering, denoise=denoise, level=level)
+        if features is None:
+            features = f
+        else:
+            features = np.hstack((features, f))
+
+    if collectHaralickFeatures:
+        f = haralick_feature(img, distance=distance)
+        if features is None:
+            features = f
+        else:
+            features = np.hstack((features, f))
+
+    if collectLBPFeatures:
+        f = lbp_feature(img, P, R)
+        if features is None:
+            features = f
+        else:
+            features = np.hstack((features, f))
+
+    return features
+
+
+def collect_features_from_file(filename, collectAreaFeatures, collectSpatialFeatures, collectHaralickFeatures,
+                               collectLBPFeatures, cache=None, **params):
+    if cache is None:
+        # Only the rows kept by crop_image are decoded, where possible.
+        img = read_image(filename, crop_rows, gray=False)
+        return collect_features(img, collectAreaFeatures, collectSpatialFeatures, collectHaralickFeatures,
+                                collectLBPFeatures, crop=False, **params)
+
+    # Look up every feature family by image content and parameters; the image is only decoded on a miss.
+    feature_names = [fn for fn, active in zip(['area', 'spatial', 'haralick', 'lbp'],
+                                              [collectAreaFeatures, collectSpatialFeatures,
+                                               collectHaralickFeatures, collectLBPFeatures]) if active]
+    # The GUI reads color images and always crops them with crop_image, so its entries are kept apart from those
+    # of features.features under the 'gui' variant.
+    key_params = dict(CACHE_KEY_DEFAULTS)
+    key_params.update(params)
+    key_params['with_info_bar'] = True
+    with open(filename, 'rb') as f:
+        data = f.read()
+    digest = file_digest(data)
+    keys = {fn: cache.key(digest, fn, key_params, variant='gui') for fn in feature_names}
+    found = {}
+    for fn in feature_names:
+        value = cache.get(keys[fn])
+        if value is not None:
+            found[fn] = value
+
+    missing = [fn for fn in feature_names if fn not in found]
+    if len(missing) > 0:
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise FileNotFoundError('Failed to load image: {:s}'.format(filename))
+        f = collect_features(img, 'area' in missing, 'spatial' in missing, 'haralick' in missing, 'lbp' in missing,
+                             **params)[0]
+        sizes = {'area': 3, 'spatial': 14, 'haralick': 13, 'lbp': key_params['P'] + 2}
+        start = 0
+        for fn in missing:
+            found[fn] = f[start:start + sizes[fn]]
+            cache.put(keys[fn], found[fn])
+            start += sizes[fn]
+
+    return np.expand_dims(np.hstack([found[fn] for fn in feature_names]), 0)
+
+
+if __name__ == '__main__':
+    img = cv2.imread('/Users/wufeim/Documents/images/DUM1142 002 500X 30keV HC14 Center LBE 002.tif')
+    img = crop_image(img)
+    f = segmentation_feature(img, True, True, d=15, sigma_color=75, sigma_space=75)
+    print(f.shape)
@@ -5,7 +5,7 @@
 # @Author: Wufei Ma
 
 from PyQt5.QtWidgets import (QDialog, QGridLayout, QGroupBox, QLabel, QLineEdit, QPushButton, QVBoxLayout, QMessageBox,
-                             QMainWindow)
+                             QMainWindow, QComboBox)
 from PyQt5.QtGui import QDesktopServices
 from PyQt5.QtCore import QUrl, pyqtSignal
 
@@ -27,6 +27,10 @@ class ParamDialog(QDialog, QMainWindow):
         self.kernel_size1 = params['ksize1']
         self.kernel_size2 = params['ksize2']
         self.kernel_size3 = params['ksize3']
+        self.n_workers = params['n_workers']
+        self.clustering = params['clustering']
+        self.denoise = params['denoise']
+        self.level = params['level']
 
         self.createParamGroup()
         self.createKernelGroup1()
@@ -83,6 +87,31 @@ class ParamDialog(QDialog, QMainWindow):
         grid.addWidget(QLabel('sigma_space ='), 2, 2)
         grid.addWidget(self.sigmaSpaceEdit, 2, 3)
 
+        self.nWorkersEdit = QLineEdit()
+        self.nWorkersEdit.setPlaceholderText(str(self.n_workers))
+        grid.addWidget(QLabel('workers ='), 3, 0)
+        grid.addWidget(self.nWorkersEdit, 3, 1)
+
+        self.clusteringBox = QComboBox()
+        self.clusteringBox.addItems(['histogram', 'kmeans'])
+        self.clusteringBox.setCurrentText(self.clustering)
+        grid.addWidget(QLabel('clustering ='), 3, 2)
+        grid.addWidget(self.clusteringBox, 3, 3)
+
+        self.denoiseBox = QComboBox()
+        self.denoiseBox.addItems(['bilateral', 'downsampled', 'guided'])
+        self.denoiseBox.setCurrentText(self.denoise)
+        self.denoiseBox.setToolTip('Filter applied before segmentation; downsampled and guided are faster '
+                                   'approximations of the bilateral filter.')
+        grid.addWidget(QLabel('denoise ='), 4, 0)
+        grid.addWidget(self.denoiseBox, 4, 1)
+
+        self.levelEdit = QLineEdit()
+        self.levelEdit.setPlaceholderText(str(self.level))
+        self.levelEdit.setToolTip('Segment an image shrunk by half level times; 1 processes 4x fewer pixels.')
+        grid.addWidget(QLabel('pyramid level ='), 4, 2)
+        grid.addWidget(self.levelEdit, 4, 3)
+
         grid.setColumnStretch(0, 10)
         grid.setColumnStretch(1, 10)
         grid.setColumnStretch(2, 10)
@@ -251,6 +280,31 @@ class ParamDialog(QDialog, QMainWindow):
                 QMessageBox.critical(self, 'Error!', 'Invalid input for ksize3.', QMessageBox.Ok)
                 return None
 
+        if self.nWorkersEdit.text() == '':
+            submit_params['n_workers'] = 1
+        else:
+            try:
+                submit_params['n_workers'] = int(self.nWorkersEdit.text())
+                if submit_params['n_workers'] < 1:
+                    raise ValueError
+            except:
+                QMessageBox.critical(self, 'Error!', 'Invalid input for workers.', QMessageBox.Ok)
+                return None
+
+        submit_params['clustering'] = self.clusteringBox.currentText()
+        submit_params['denoise'] = self.denoiseBox.currentText()
+
+        if self.levelEdit.text() == '':
+            submit_params['level'] = 0
+        else:
+            try:
+                submit_params['level'] = int(self.levelEdit.text())
+                if submit_params['level'] < 0:
+                    raise ValueError
+            except:
+                QMessageBox.critical(self, 'Error!', 'Invalid input for pyramid level.', QMessageBox.Ok)
+                return None
+
         self.returnParamSignal.emit(submit_params)
 
         self.close()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename: sweepThread.py
+# @Date: 2026-10-18
+# @Author: Wufei Ma
+
+from PyQt5.QtCore import pyqtSignal, QThread
+
+from imageFeatures import crop_rows
+from features.parallel import imap_images
+from features.sweep import distinct_stages, sweep_image_file, write_sweep
+
+
+class SweepThread(QThread):
+    """Collect features of every image for every setting of a parameter sweep, see features/sweep.py; every stage
+    shared by several settings runs once per image."""
+
+    incremental_signal = pyqtSignal()
+    output_signal = pyqtSignal(str)
+    complete_signal = pyqtSignal()
+
+    def __init__(self, filenames, featureNames, settings, outputPrefix, n_workers=1):
+        QThread.__init__(self)
+        self.filenames = filenames
+        self.featureNames = featureNames
+        self.settings = settings
+        self.outputPrefix = outputPrefix
+        self.n_workers = n_workers
+
+        self.running = True
+
+    def __del__(self):
+        self.wait()
+
+    def run(self):
+        self.running = True
+
+        stages = distinct_stages(self.settings, self.featureNames)
+        self.output_signal.emit('Sweep over {:d} settings; stages per image: {:s}.'.format(
+            len(self.settings), ', '.join('{:s} {:d}'.format(k, v) for k, v in stages.items())))
+
+        filenames = []
+        rows = [[] for _ in self.settings]
+        results = imap_images(sweep_image_file, self.filenames, n_workers=self.n_workers, settings=self.settings,
+                              feature_names=self.featureNames, crop=crop_rows)
+        for fname, result, error in results:
+            if not self.running:
+                results.close()
+                return None
+            self.incremental_signal.emit()
+            if error is not None:
+                self.output_signal.emit('Failed to collect features from {:s}: {:s}'.format(fname, error))
+                continue
+            filenames.append(fname)
+            for r, f in zip(rows, result[0]):
+                r.append(f)
+
+        if self.running:
+            write_sweep(self.outputPrefix, filenames, self.settings, rows, self.featureNames)
+            self.output_signal.emit('Completed! Features of {:d} images for {:d} settings exported to {:s}_*.csv; '
+                                    'settings are listed in {:s}.csv.'.format(len(filenames), len(self.settings),
+                                                                             self.outputPrefix, self.outputPrefix))
+            self.incremental_signal.emit()
+            self.complete_signal.emit()
+
+    def stop(self):
+        self.running = False
@@ -4,24 +4,35 @@
 # @Date : 2020-05-03
 # @Author : Wufei Ma
 
-import os
-import sys
-from joblib import dump, load
-import collections
+import time
+from joblib import Parallel, delayed
 
-import cv2
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
 from sklearn.model_selection import StratifiedKFold
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import f1_score, matthews_corrcoef
 
 
-def train_random_forest(X, Y, logger):
+def predict_from_proba(model, proba):
+    """The labels model.predict gives, from the output of
+    model.predict_proba, so that both come from one pass over the trees."""
+    return model.classes_.take(np.argmax(proba, axis=1), axis=0)
+
+
+def tree_diagnostics(model):
+    """Average number of nodes and maximum depth of the trees of a forest."""
+    n_nodes = [t.tree_.node_count for t in model.estimators_]
+    max_depths = [t.tree_.max_depth for t in model.estimators_]
+    return int(np.mean(n_nodes)), int(np.mean(max_depths))
+
+
+def train_random_forest(X, Y, logger, diagnostics=False):
+    """5-fold cross-validation of a random forest; returns the model of the
+    last fold. Each fold costs the fit and one predict_proba pass over the
+    test set. With diagnostics=True the tree sizes and the accuracy and F1
+    on the training set are logged as well, which costs a pass over the
+    training set."""
     if len(Y.shape) > 1:
         Y = Y.flatten()
     skf = StratifiedKFold(n_splits=5)
@@ -38,21 +49,27 @@ def train_random_forest(X, Y, logger):
         model = RandomForestClassifier(n_estimators=100, criterion='entropy',
                                        max_features='sqrt',
                                        n_jobs=-1, verbose=0)
+        start = time.time()
         model.fit(train, train_labels)
-        n_nodes = []
-        max_depths = []
-
-        for ind_tree in model.estimators_:
-            n_nodes.append(ind_tree.tree_.node_count)
-            max_depths.append(ind_tree.tree_.max_depth)
-
-        logger.log(f'    Average number of nodes {int(np.mean(n_nodes))}')
-        logger.log(f'    Average maximum depth {int(np.mean(max_depths))}')
-
-        train_rf_predictions = model.predict(train)
-        train_rf_probs = model.predict_proba(train)[:, 1]
-        rf_predictions = model.predict(test)
-        rf_probs = model.predict_proba(test)[:, 1]
+        fit_time = time.time() - start
+
+        start = time.time()
+        rf_probs = model.predict_proba(test)
+        rf_predictions = predict_from_proba(model, rf_probs)
+        predict_time = time.time() - start
+        logger.log('    Fit: {:.2f}s, predict: {:.2f}s'.format(fit_time,
+                                                              predict_time))
+
+        if diagnostics:
+            n_nodes, max_depth = tree_diagnostics(model)
+            logger.log(f'    Average number of nodes {n_nodes}')
+            logger.log(f'    Average maximum depth {max_depth}')
+            train_rf_predictions = model.predict(train)
+            logger.log('    Training accuracy: {}'.format(
+                np.mean(train_rf_predictions == train_labels)))
+            logger.log('    Training F1: {}'.format(
+                f1_score(train_labels, train_rf_predictions,
+                         average='weighted')))
 
         if np.sum(test_labels == 0) == 0 or np.sum(test_labels == 1) == 0:
             # print('Error: Only one label in test_labels.')
@@ -72,47 +89,155 @@ def train_random_forest(X, Y, logger):
     return model
 
 
-def train_random_forest_f1_mcc(X, Y):
+# Numbers of trees tried by tree_count_sweep.
+TREE_COUNTS = [10, 25, 50, 100, 200, 400]
+
+
+def oob_scores(model, Y):
+    """Accuracy, weighted F1 and MCC of the out-of-bag predictions of a
+    forest fitted with oob_score=True. Samples that were in the bootstrap
+    sample of every tree have no out-of-bag prediction and are left out."""
+    proba = model.oob_decision_function_
+    valid = ~np.isnan(proba).any(axis=1) & (proba.sum(axis=1) > 0)
+    predictions = predict_from_proba(model, proba[valid])
+    labels = Y[valid]
+    return (np.mean(predictions == labels),
+            f1_score(labels, predictions, average='weighted'),
+            matthews_corrcoef(labels, predictions))
+
+
+def train_random_forest_oob(X, Y, logger, n_estimators=100, n_jobs=-1,
+                            random_state=None):
+    """Fit one random forest on all of X and evaluate it on the samples each
+    tree did not see, instead of fitting a forest on each of 5 folds.
+    Returns the forest, which is trained on all the data."""
     if len(Y.shape) > 1:
         Y = Y.flatten()
-    skf = StratifiedKFold(n_splits=5)
-    count = 1
-    f1_scores = []
-    mcc = []
-    for train_index, test_index in skf.split(np.zeros((len(Y), 1)), Y):
-        count += 1
-        train_labels = Y[train_index]
-        test_labels = Y[test_index]
-        train = X[train_index]
-        test = X[test_index]
-        model = RandomForestClassifier(n_estimators=100,
-                                       max_features='sqrt',
-                                       n_jobs=-1, verbose=0)
-        model.fit(train, train_labels)
-        n_nodes = []
-        max_depths = []
-
-        for ind_tree in model.estimators_:
-            n_nodes.append(ind_tree.tree_.node_count)
-            max_depths.append(ind_tree.tree_.max_depth)
+    model = RandomForestClassifier(n_estimators=n_estimators,
+                                   criterion='entropy', max_features='sqrt',
+                                   oob_score=True, n_jobs=n_jobs, verbose=0,
+                                   random_state=random_state)
+    start = time.time()
+    model.fit(X, Y)
+    logger.log('Fit: {:.2f}s'.format(time.time() - start))
+
+    acc, f1, mcc = oob_scores(model, Y)
+    logger.log('OOB accuracy: {}'.format(acc))
+    logger.log('OOB F1: {}'.format(f1))
+    logger.log('OOB MCC: {}'.format(mcc))
+    logger.log('Feature importances: {}'.format(model.feature_importances_))
+    return model
 
-        train_rf_predictions = model.predict(train)
-        train_rf_probs = model.predict_proba(train)[:, 1]
-        rf_predictions = model.predict(test)
-        rf_probs = model.predict_proba(test)[:, 1]
 
-        if np.sum(test_labels == 0) == 0 or np.sum(test_labels == 1) == 0:
-            print('Error: Only one label in test_labels.')
-            continue
-        if np.sum(rf_predictions == 0) == 0 or np.sum(rf_predictions == 1) == 1:
-            print('Error: Only one label in rf_predictions.')
+def tree_count_sweep(X, Y, logger, tree_counts=TREE_COUNTS,
+                     target_accuracy=None, n_jobs=-1, random_state=None):
+    """Grow one random forest through the numbers of trees in tree_counts
+    with warm_start, so that every tree is fitted once, and log the
+    out-of-bag scores at each count. Stops at the first count whose OOB
+    accuracy reaches target_accuracy, if given. Returns the forest at that
+    count and a list of (n_estimators, accuracy, F1, MCC)."""
+    if len(Y.shape) > 1:
+        Y = Y.flatten()
+    model = RandomForestClassifier(n_estimators=tree_counts[0],
+                                   criterion='entropy', max_features='sqrt',
+                                   oob_score=True, warm_start=True,
+                                   n_jobs=n_jobs, verbose=0,
+                                   random_state=random_state)
+    scores = []
+    start = time.time()
+    for n in tree_counts:
+        model.set_params(n_estimators=n)
+        model.fit(X, Y)
+        acc, f1, mcc = oob_scores(model, Y)
+        scores.append((n, acc, f1, mcc))
+        logger.log('    {:d} trees: OOB accuracy {:.4f}, F1 {:.4f}, '
+                   'MCC {:.4f} ({:.2f}s)'.format(n, acc, f1, mcc,
+                                                 time.time() - start))
+        if target_accuracy is not None and acc >= target_accuracy:
+            break
+    if target_accuracy is not None and scores[-1][1] < target_accuracy:
+        logger.log('Target accuracy {} not reached with {:d} trees'
+                   .format(target_accuracy, scores[-1][0]))
+    return model, scores
+
+
+def fold_f1_mcc(X, Y, train_index, test_index, n_jobs=1, random_state=None):
+    """Weighted F1 and MCC on the test fold of a random forest trained on the
+    training fold, and None; or None and the reason if the test labels or
+    the predictions have a single label. Also returns the fit and predict
+    times. Nothing is printed, since this runs in joblib workers."""
+    train_labels = Y[train_index]
+    test_labels = Y[test_index]
+    train = X[train_index]
+    test = X[test_index]
+    model = RandomForestClassifier(n_estimators=100,
+                                   max_features='sqrt',
+                                   n_jobs=n_jobs, verbose=0,
+                                   random_state=random_state)
+    start = time.time()
+    model.fit(train, train_labels)
+    fit_time = time.time() - start
+
+    start = time.time()
+    rf_predictions = model.predict(test)
+    times = fit_time, time.time() - start
+
+    if np.sum(test_labels == 0) == 0 or np.sum(test_labels == 1) == 0:
+        return None, 'Only one label in test_labels.', times
+    if np.sum(rf_predictions == 0) == 0 or np.sum(rf_predictions == 1) == 0:
+        return None, 'Only one label in rf_predictions.', times
+
+    return (f1_score(test_labels, rf_predictions, average='weighted'),
+            matthews_corrcoef(test_labels, rf_predictions)), None, times
+
+
+def cross_validate_f1_mcc(datasets, n_splits=5, n_jobs=-1, inner_jobs=1,
+                          random_state=None, verbose=0, logger=None):
+    """Mean F1 and MCC over the stratified folds of every (X, Y) dataset.
+
+    The folds of all datasets are fitted as one pool of n_jobs joblib
+    workers, each forest with inner_jobs threads, so that many small fits
+    keep all cores busy instead of running one after another on threads
+    that mostly wait. Results are in the order of datasets, whatever order
+    the folds finish in. With an integer random_state, the forest of the
+    k-th fold overall is seeded with random_state + k, which makes the
+    scores reproducible for any n_jobs. The fit and predict times of every
+    fold are logged in fold order with logger, or printed without one.
+    """
+    tasks = []
+    for i, (X, Y) in enumerate(datasets):
+        if len(Y.shape) > 1:
+            Y = Y.flatten()
+        skf = StratifiedKFold(n_splits=n_splits)
+        for train_index, test_index in skf.split(np.zeros((len(Y), 1)), Y):
+            tasks.append((i, X, Y, train_index, test_index))
+
+    results = Parallel(n_jobs=n_jobs, verbose=verbose)(
+        delayed(fold_f1_mcc)(X, Y, train_index, test_index, inner_jobs,
+                             None if random_state is None
+                             else random_state + k)
+        for k, (i, X, Y, train_index, test_index) in enumerate(tasks))
+
+    log = print if logger is None else logger.log
+    scores = [[] for _ in datasets]
+    for k, ((i, _, _, _, _), (r, reason, (fit_time, predict_time))) in \
+            enumerate(zip(tasks, results)):
+        log('Dataset {:d}, fold {:d}:'.format(i, k % n_splits))
+        log('    Fit: {:.2f}s, predict: {:.2f}s'.format(fit_time,
+                                                       predict_time))
+        if r is None:
+            log('Error: {:s} (dataset {:d}, fold {:d})'.format(
+                reason, i, k % n_splits))
             continue
+        scores[i].append(r)
+    return [(np.mean([r[0] for r in s]), np.mean([r[1] for r in s]))
+            for s in scores]
+
 
-        # a = sum((rf_predictions == test_labels) / len(test))
-        f1_scores.append(f1_score(test_labels, rf_predictions,
-                                  average='weighted'))
-        mcc.append(matthews_corrcoef(test_labels, rf_predictions))
-    return np.mean(f1_scores), np.mean(mcc)
+def train_random_forest_f1_mcc(X, Y, n_jobs=-1, random_state=None,
+                               logger=None):
+    return cross_validate_f1_mcc([(X, Y)], n_jobs=n_jobs,
+                                 random_state=random_state, logger=logger)[0]
 
 
 if __name__ == '__main__':
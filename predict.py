@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : predict.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+
+import numpy as np
+from joblib import load
+
+from features.features import FEATURE_ORDER, feature_columns, image_features
+from features.parallel import imap_images
+from segment_image import find_images
+
+# Labels of the classes predicted in each training mode of train.py.
+LABELS = {
+    '10-class': ['DUM1178', 'DUM1154', 'DUM1297', 'DUM1144', 'DUM1150',
+                 'DUM1160', 'DUM1180', 'DUM1303', 'DUM1142', 'DUM1148'],
+    'binary': ['HT1', 'HT2']
+}
+
+
+def model_info_filename(model_file):
+    return os.path.splitext(model_file)[0] + '.json'
+
+
+def write_model_info(model_file, mode, feature_names, P=10):
+    """Write the training mode and the feature columns of a model next to
+    it, which is what Classifier needs to use it. P is that of the LBP
+    features of the feature table."""
+    info = {'mode': mode, 'feature_names': list(feature_names),
+            'labels': LABELS[mode], 'P': P}
+    with open(model_info_filename(model_file), 'w') as f:
+        json.dump(info, f, indent=2)
+
+
+class Classifier(object):
+    """A model saved by train.py, loaded once, and the features it takes.
+
+    The model is memory-mapped by joblib with mmap=True, so that processes
+    loading the same file share its arrays. The training mode and feature
+    columns are read from the .json file train.py writes next to the model.
+    """
+
+    def __init__(self, model_file, mmap=True):
+        info_file = model_info_filename(model_file)
+        if not os.path.isfile(info_file):
+            raise FileNotFoundError(
+                'No model info {:s}; write it with predict.write_model_info '
+                'or train the model again.'.format(info_file))
+        with open(info_file, 'r') as f:
+            info = json.load(f)
+        self.mode = info['mode']
+        self.columns = info['feature_names']
+        self.model = load(model_file, mmap_mode='r' if mmap else None)
+        self.labels = [info['labels'][int(c)] for c in self.model.classes_]
+
+        # Feature families to collect, and where the model's columns are in
+        # the feature vectors of features.features.image_features.
+        families = set(c.rsplit('_', 1)[0] for c in self.columns)
+        self.feature_names = [fn for fn in FEATURE_ORDER if fn in families]
+        self.P = info.get('P', 10)
+        all_columns = feature_columns(self.feature_names, self.P)
+        unknown = [c for c in self.columns if c not in all_columns]
+        if len(unknown) > 0:
+            raise ValueError('Unknown feature columns: {}'.format(unknown))
+        self.index = [all_columns.index(c) for c in self.columns]
+
+    def predict_proba(self, features):
+        """Class probabilities of feature vectors with all the columns of
+        feature_names, in the order of labels."""
+        features = np.atleast_2d(features)
+        return self.model.predict_proba(features[:, self.index])
+
+    def predict(self, features):
+        return [self.labels[i] for i in
+                np.argmax(self.predict_proba(features), axis=1)]
+
+
+def predict_images(classifier, image_names, batch_size=32, n_workers=1,
+                   executor=None, **kwargs):
+    """Classify image files.
+
+    Features are computed over a pool of n_workers processes (or the given
+    executor), which lives for all the images, and are classified in batches
+    of batch_size in this process, so the model is only loaded once. Yields
+    (image name, probabilities, error) in the order of image_names, a batch
+    at a time; remaining arguments are passed to image_features.
+    """
+    batch = []
+
+    def classify(batch):
+        rows = [r for _, r, e in batch if e is None]
+        proba = iter(classifier.predict_proba(np.array(rows))
+                     if len(rows) > 0 else [])
+        return [(name, next(proba) if error is None else None, error)
+                for name, _, error in batch]
+
+    for item in imap_images(image_features, image_names, n_workers=n_workers,
+                            executor=executor,
+                            feature_names=classifier.feature_names,
+                            P=classifier.P, **kwargs):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from classify(batch)
+            batch = []
+    if len(batch) > 0:
+        yield from classify(batch)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Classify microstructure images with a trained model.')
+    parser.add_argument('model', type=str,
+                        help='model saved by train.py (.joblib)')
+    parser.add_argument('inputs', type=str, nargs='+', metavar='input',
+                        help='image files, directories or glob patterns')
+    parser.add_argument('--output', type=str, default=None,
+                        help='csv file of the predictions; printed if not '
+                             'given')
+    parser.add_argument('--pattern', type=str, default='*.tif *.tiff *.png',
+                        help='filename patterns of the images in '
+                             'directories, split by space')
+    parser.add_argument('--recursive', action='store_true',
+                        help='also search subdirectories')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes; 0 uses all cores')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--no-mmap', action='store_true',
+                        help='load the model into memory')
+    parser.add_argument('--no-info-bar', action='store_true',
+                        help='the images have no info bar to crop')
+    # Feature parameters; they should be those of the training table.
+    parser.add_argument('--d', type=int, default=15)
+    parser.add_argument('--sigma-color', type=float, default=75)
+    parser.add_argument('--sigma-space', type=float, default=75)
+    parser.add_argument('--clustering', type=str, default='histogram')
+    parser.add_argument('--denoise', type=str, default='bilateral')
+    parser.add_argument('--level', type=int, default=0)
+    parser.add_argument('--ksize0', type=int, default=9)
+    parser.add_argument('--ksize1', type=int, default=9)
+    parser.add_argument('--ksize2', type=int, default=9)
+    parser.add_argument('--ksize3', type=int, default=3)
+    parser.add_argument('--distance', type=int, default=1)
+    parser.add_argument('--R', type=float, default=5)
+    args = parser.parse_args()
+
+    start = time.time()
+    classifier = Classifier(args.model, mmap=not args.no_mmap)
+    print('Loaded {:s} model in {:.2f} s.'.format(classifier.mode,
+                                                   time.time() - start),
+          file=sys.stderr)
+
+    image_files = find_images(args.inputs, args.pattern.split(),
+                              args.recursive)
+    if len(image_files) == 0:
+        print('No images found.', file=sys.stderr)
+        sys.exit(1)
+
+    out = open(args.output, 'w', newline='') if args.output is not None \
+        else sys.stdout
+    writer = csv.writer(out)
+    writer.writerow(['filename', 'prediction'] +
+                    ['p_' + x for x in classifier.labels])
+    start = time.time()
+    n_done = n_failed = 0
+    for i, (image_file, proba, error) in enumerate(predict_images(
+            classifier, image_files, batch_size=args.batch_size,
+            n_workers=args.workers if args.workers > 0 else None,
+            with_info_bar=not args.no_info_bar, d=args.d,
+            sigma_color=args.sigma_color, sigma_space=args.sigma_space,
+            clustering=args.clustering, denoise=args.denoise,
+            level=args.level, ksize0=args.ksize0,
+            ksize1=args.ksize1, ksize2=args.ksize2, ksize3=args.ksize3,
+            distance=args.distance, R=args.R)):
+        if error is not None:
+            n_failed += 1
+            print('Failed to classify {:s}: {:s}'.format(image_file, error),
+                  file=sys.stderr)
+        else:
+            n_done += 1
+            writer.writerow(
+                [image_file, classifier.labels[int(np.argmax(proba))]] +
+                ['{:.4f}'.format(p) for p in proba])
+        if (i + 1) % args.batch_size == 0 or i + 1 == len(image_files):
+            out.flush()
+            print('[{:d}/{:d}]'.format(i + 1, len(image_files)),
+                  file=sys.stderr)
+    if out is not sys.stdout:
+        out.close()
+
+    elapsed = time.time() - start
+    print('Classified {:d} images in {:.1f} s ({:.2f} images/s); {:d} '
+          'failed.'.format(n_done, elapsed, n_done / max(elapsed, 1e-9),
+                           n_failed), file=sys.stderr)
+    if n_failed > 0:
+        sys.exit(1)
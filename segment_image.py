@@ -6,23 +6,216 @@
 
 import os
 import sys
+import glob
+import json
+import time
+import fnmatch
 import argparse
+
 import cv2
-import utils
 
+from features.core import Workspace, segment, segmentation_image
+from features.imagesource import read_image, crop_rows
+from features.parallel import imap_images
+
+# Scratch buffers of the segmentation, reused by every image a process
+# segments.
+_workspace = Workspace()
+
+
+def find_images(inputs, patterns=('*.tif', '*.tiff', '*.png'),
+                recursive=False):
+    """Image files named by inputs: files, directories (the files in them
+    matching patterns) and glob patterns; in order, without duplicates."""
+    found = []
+    for path in inputs:
+        if os.path.isdir(path):
+            if recursive:
+                names = [os.path.join(root, f)
+                         for root, _, files in os.walk(path) for f in files]
+            else:
+                names = [os.path.join(path, f) for f in os.listdir(path)]
+            found += sorted(f for f in names if os.path.isfile(f) and any(
+                fnmatch.fnmatch(os.path.basename(f), p) for p in patterns))
+        elif glob.has_magic(path):
+            found += sorted(f for f in glob.glob(path, recursive=True)
+                            if os.path.isfile(f))
+        else:
+            found.append(path)
+    seen = set()
+    return [f for f in found if not (f in seen or seen.add(f))]
+
+
+def output_filenames(image_files, output_dir):
+    """Segmentation image of each of image_files, under output_dir. The
+    directories of the images below their common directory are kept, so
+    a/x.tif and b/x.tif give a/segmentation_x.png and b/segmentation_x.png;
+    only the last extension is dropped."""
+    dirs = [os.path.dirname(os.path.abspath(f)) for f in image_files]
+    root = os.path.commonpath(dirs) if len(dirs) > 0 else ''
+    return [os.path.normpath(os.path.join(
+        output_dir, os.path.relpath(d, root),
+        'segmentation_' + os.path.splitext(os.path.basename(f))[0] + '.png'))
+        for f, d in zip(image_files, dirs)]
+
+
+def collisions(jobs):
+    """Output files shared by more than one image of jobs, e.g. those of
+    x.tif and x.png, and the images writing them."""
+    images = {}
+    for image_file, output_file in jobs:
+        images.setdefault(output_file, []).append(image_file)
+    return {o: fs for o, fs in images.items() if len(fs) > 1}
+
+
+def params_filename(output_file):
+    return output_file + '.params'
+
+
+def read_params(output_file):
+    """Params output_file was written with, or None if not recorded."""
+    try:
+        with open(params_filename(output_file), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_params(output_file, params):
+    tmp = params_filename(output_file) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(params, f, sort_keys=True)
+    os.replace(tmp, params_filename(output_file))
+
+
+def same_params(output_file, params):
+    """Whether output_file was written with params, as recorded next to it
+    by segment_file."""
+    # Through JSON, so that e.g. tuples compare equal to the lists read.
+    return read_params(output_file) == json.loads(json.dumps(params))
+
+
+def up_to_date(image_file, output_file, params):
+    """Whether output_file exists, is newer than image_file and was written
+    with params (the keyword arguments of segment_file)."""
+    return os.path.isfile(output_file) and \
+        os.path.getmtime(output_file) >= os.path.getmtime(image_file) and \
+        same_params(output_file, params)
+
+
+def overlay_image(img, seg, alpha=None):
+    """Segmentation image of seg, blended over the grayscale image img with
+    weight alpha if given."""
+    out = segmentation_image(seg)
+    if alpha is not None:
+        out = cv2.addWeighted(cv2.cvtColor(img, cv2.COLOR_GRAY2BGR),
+                              1 - alpha, out, alpha, 0)
+    return out
+
+
+def segment_file(files, with_info_bar=True, overlay=None, **kwargs):
+    """Segment the image file files[0] and write the segmentation image, or
+    the segmentation blended over the image with weight overlay, to
+    files[1]. The arguments are recorded in files[1] + '.params', see
+    up_to_date. Returns the number of pixels segmented."""
+    image_file, output_file = files
+    img = read_image(image_file, crop_rows if with_info_bar else None)
+    seg = segment(img, components=False, workspace=_workspace, **kwargs)
+    out = overlay_image(img, seg, overlay)
+    if not cv2.imwrite(output_file, out):
+        raise IOError('Failed to write {:s}'.format(output_file))
+    write_params(output_file, dict(kwargs, with_info_bar=with_info_bar,
+                                   overlay=overlay))
+    return img.size
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Microstructure image segmentation.')
+    parser.add_argument('inputs', type=str, nargs='+', metavar='input',
+                        help='image files, directories or glob patterns')
+    parser.add_argument('--output-dir', type=str, default='figures',
+                        help='directory of the segmentation images')
+    parser.add_argument('--pattern', type=str, default='*.tif *.tiff *.png',
+                        help='filename patterns of the images in '
+                             'directories, split by space')
+    parser.add_argument('--recursive', action='store_true',
+                        help='also search subdirectories')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes; 0 uses all cores')
+    parser.add_argument('--force', action='store_true',
+                        help='also segment images whose output is newer '
+                             'than the image')
+    parser.add_argument('--overlay', type=float, default=None,
+                        metavar='ALPHA',
+                        help='blend the segmentation over the image with '
+                             'weight ALPHA instead of writing it alone')
+    parser.add_argument('--no-info-bar', action='store_true',
+                        help='the images have no info bar to crop')
+    parser.add_argument('--d', type=int, default=15)
+    parser.add_argument('--sigma-color', type=float, default=75)
+    parser.add_argument('--sigma-space', type=float, default=75)
+    parser.add_argument('--clustering', type=str, default='histogram')
+    parser.add_argument('--denoise', type=str, default='bilateral')
+    parser.add_argument('--level', type=int, default=0)
+    parser.add_argument('--ksize0', type=int, default=9)
+    parser.add_argument('--ksize1', type=int, default=9)
+    parser.add_argument('--ksize2', type=int, default=9)
+    parser.add_argument('--ksize3', type=int, default=3)
+    args = parser.parse_args()
 
-parser = argparse.ArgumentParser(description='Microstructure image segmentation.')
-parser.add_argument('img_file', type=str, metavar='img_file',
-                    help='path to the image file')
-args = parser.parse_args()
+    image_files = find_images(args.inputs, args.pattern.split(),
+                              args.recursive)
+    if len(image_files) == 0:
+        print('No images found.')
+        sys.exit(1)
+    jobs = list(zip(image_files,
+                    output_filenames(image_files, args.output_dir)))
+    clashes = collisions(jobs)
+    if len(clashes) > 0:
+        for output_file, files in sorted(clashes.items()):
+            print('{:s} would be written by {:s}.'.format(
+                output_file, ', '.join(files)))
+        print('Rename the images or segment them in separate runs.')
+        sys.exit(1)
+    for output_dir in sorted(set(os.path.dirname(o) for _, o in jobs)):
+        os.makedirs(output_dir, exist_ok=True)
+    params = {'with_info_bar': not args.no_info_bar, 'overlay': args.overlay,
+              'd': args.d, 'sigma_color': args.sigma_color,
+              'sigma_space': args.sigma_space, 'clustering': args.clustering,
+              'denoise': args.denoise, 'level': args.level,
+              'ksize0': args.ksize0, 'ksize1': args.ksize1,
+              'ksize2': args.ksize2, 'ksize3': args.ksize3}
+    todo = [job for job in jobs
+            if args.force or not up_to_date(job[0], job[1], params)]
+    # Outputs that are newer than their images but were written with
+    # other params, or before the params were recorded.
+    n_changed = sum(1 for job in todo if os.path.isfile(job[1]) and
+                    not same_params(job[1], params))
+    print('{:d} images found, {:d} to segment ({:d} with other params), '
+          '{:d} up to date.'.format(len(jobs), len(todo), n_changed,
+                                    len(jobs) - len(todo)))
 
-img = cv2.imread(args.img_file, cv2.IMREAD_GRAYSCALE)
-if img is None:
-    raise ValueError('Failed to read the image: {:s}'.format(args.img_file))
-img = utils.segment_image(img)
+    start = time.time()
+    n_pixels = n_done = n_failed = 0
+    for i, (job, result, error) in enumerate(imap_images(
+            segment_file, todo,
+            n_workers=args.workers if args.workers > 0 else None,
+            **params)):
+        if error is not None:
+            n_failed += 1
+            print('[{:d}/{:d}] Failed to segment {:s}: {:s}'.format(
+                i + 1, len(todo), job[0], error))
+            continue
+        n_done += 1
+        n_pixels += result
+        print('[{:d}/{:d}] {:s}'.format(i + 1, len(todo), job[1]))
 
-out_file = os.path.join(
-    'figures',
-    'segmentation_' + os.path.basename(args.img_file).split('.')[0] + '.png'
-)
-cv2.imwrite(out_file, img)
+    elapsed = time.time() - start
+    print('Segmented {:d} images in {:.1f} s ({:.2f} images/s, {:.1f} '
+          'megapixels/s); {:d} failed.'.format(
+              n_done, elapsed, n_done / max(elapsed, 1e-9),
+              n_pixels / 1e6 / max(elapsed, 1e-9), n_failed))
+    if n_failed > 0:
+        sys.exit(1)
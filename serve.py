@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : serve.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+import json
+import time
+import queue
+import base64
+import argparse
+import ipaddress
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+import cv2
+import numpy as np
+
+from features.features import FEATURE_ORDER, feature_columns, array_features
+from features.imagesource import read_image, crop_rows, crop_image
+from segment_image import overlay_image
+
+# Feature families returned by /features when none are requested and no
+# model is loaded.
+DEFAULT_FEATURES = ['area', 'spatial']
+
+# Smallest number of rows and columns of an image (after cropping its info
+# bar) that the features can be computed of.
+MIN_SIZE = 2
+
+
+def is_loopback(host):
+    """Whether host is a loopback address, so that only local clients can
+    connect to a server bound to it."""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def allowed_path(path, roots):
+    """Whether path is below one of the directories roots (real paths),
+    after resolving symbolic links."""
+    path = os.path.realpath(path)
+    return any(os.path.commonpath([path, root]) == root for root in roots)
+
+
+def analyze(job):
+    """Segment one image and compute its features and overlay; runs in a
+    worker process.
+
+    job is (source, options): source is the bytes of an image file or the
+    path of one, and options holds the segmentation params, the
+    feature_names to compute and the overlay alpha (False for no overlay).
+    Returns the phase fractions, the feature vector (None without
+    feature_names), the overlay PNG (or None) and the time of each stage.
+    """
+    source, options = job
+    times = {}
+    start = time.time()
+    with_info_bar = options['with_info_bar']
+    try:
+        if isinstance(source, bytes):
+            img = cv2.imdecode(np.frombuffer(source, np.uint8),
+                               cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                raise ValueError('The upload is not an image.')
+            if with_info_bar:
+                img = crop_image(img)
+        else:
+            img = read_image(source, crop_rows if with_info_bar else None)
+    except (ValueError, FileNotFoundError):
+        raise
+    except Exception as e:
+        # E.g. a corrupt TIFF; reported like an image that is not one.
+        raise ValueError('Failed to read the image: {:s}: {}'.format(
+            type(e).__name__, e))
+    if min(img.shape[:2]) < MIN_SIZE:
+        raise ValueError('The image is {:d}x{:d}, smaller than {:d}x{:d}.'
+                         .format(img.shape[0], img.shape[1], MIN_SIZE,
+                                 MIN_SIZE))
+    times['decode'] = time.time() - start
+
+    # The area features are the phase fractions, and their segmentation
+    # gives the overlay.
+    feature_names = options['feature_names']
+    values, seg = array_features(
+        img, ['area'] + feature_names, distance=options['distance'],
+        P=options['P'], R=options['R'], segmentation=True, times=times,
+        **options['params'])
+    fractions = values['area']
+    features = np.concatenate([values[fn] for fn in feature_names]) \
+        if len(feature_names) > 0 else None
+
+    png = None
+    if options['overlay'] is not False:
+        start = time.time()
+        _, png = cv2.imencode('.png',
+                              overlay_image(img, seg, options['overlay']))
+        png = png.tobytes()
+        times['overlay'] = time.time() - start
+    return fractions, features, png, times
+
+
+def _warm_up(_):
+    """Segment a small image so that a worker has imported and allocated
+    everything before the first request."""
+    img = np.random.RandomState(0).randint(0, 256, (64, 64)).astype(np.uint8)
+    array_features(img, ['area'])
+    return os.getpid()
+
+
+class Batcher(object):
+    """Collects concurrent requests into batches for the worker pool.
+
+    A request waits at most max_wait seconds for others to join its batch
+    of up to batch_size requests. The images of a batch are analyzed in
+    parallel by the executor, and the feature vectors of the batch are
+    classified in one call of the classifier, if any.
+    """
+
+    def __init__(self, executor, classifier=None, batch_size=8,
+                 max_wait=0.01):
+        self.executor = executor
+        self.classifier = classifier
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, job, classify=False):
+        """Future of the result dict of a job for analyze."""
+        future = Future()
+        self.requests.put((job, classify, future, time.time()))
+        return future
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    def _next_batch(self):
+        first = self.requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.batch_size:
+            try:
+                request = self.requests.get(
+                    timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._process(batch)
+            except Exception as e:
+                # E.g. a broken worker pool or a failing classifier; the
+                # requests of this batch fail, and the next batch is served.
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _process(self, batch):
+        started = time.time()
+        futures = [self.executor.submit(analyze, job)
+                   for job, _, _, _ in batch]
+        results = []
+        for (job, classify, future, queued), f in zip(batch, futures):
+            try:
+                fractions, features, png, times = f.result()
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            times['queue'] = started - queued
+            results.append((classify, future, fractions, features, png,
+                            times))
+
+        # One call of the classifier for all the images of the batch.
+        rows = [r for r in results if r[0]]
+        proba = []
+        if len(rows) > 0:
+            start = time.time()
+            proba = self.classifier.predict_proba(
+                np.array([r[3] for r in rows]))
+            elapsed = time.time() - start
+            for r in rows:
+                r[5]['classify'] = elapsed
+        proba = iter(proba)
+        for classify, future, fractions, features, png, times in results:
+            future.set_result({
+                'fractions': fractions, 'features': features,
+                'overlay': png, 'times': times,
+                'proba': next(proba) if classify else None,
+                'batch_size': len(batch)})
+
+
+def _json_number(x):
+    x = float(x)
+    return None if np.isnan(x) else x
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """POST /segment, /features or /classify with the bytes of an image
+    file as the body, or a JSON body {"path": <image file>}. Options are
+    given in the query string: overlay=0/1, alpha=<weight of the overlay>
+    and, for /features, features=<comma separated feature families>.
+
+    Paths are only accepted below the directories server.roots (none if
+    empty), or from any directory if server.roots is None, which is only
+    the case on a loopback bind."""
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/health':
+            self._reply(404, {'error': 'Unknown path.'})
+            return
+        classifier = self.server.classifier
+        self._reply(200, {
+            'status': 'ok', 'workers': self.server.n_workers,
+            'model': classifier.mode if classifier is not None else None})
+
+    def do_POST(self):
+        start = time.time()
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.strip('/')
+        classifier = self.server.classifier
+        if endpoint not in ['segment', 'features', 'classify']:
+            self._reply(404, {'error': 'Unknown path.'})
+            return
+        if endpoint == 'classify' and classifier is None:
+            self._reply(400, {'error': 'No model is loaded.'})
+            return
+
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length',
+                                                        0)))
+            if self.headers.get('Content-Type', '').startswith(
+                    'application/json'):
+                source = json.loads(body.decode('utf-8'))['path']
+                if not isinstance(source, str):
+                    raise TypeError('The path is not a string.')
+                roots = self.server.roots
+                if roots is not None and not allowed_path(source, roots):
+                    self._reply(403, {'error': 'The path is not below a '
+                                               '--root directory.'
+                                      if len(roots) > 0 else
+                                      'Paths are not accepted; upload the '
+                                      'image.'})
+                    return
+                if not os.path.isfile(source):
+                    raise ValueError('No such file: {:s}'.format(source))
+            else:
+                source = body
+            if len(source) == 0:
+                raise ValueError('No image given.')
+
+            if endpoint == 'segment':
+                feature_names = []
+            elif endpoint == 'classify':
+                feature_names = classifier.feature_names
+            elif 'features' in query:
+                feature_names = query['features'].split(',')
+            elif classifier is not None:
+                feature_names = classifier.feature_names
+            else:
+                feature_names = DEFAULT_FEATURES
+            unknown = [fn for fn in feature_names if fn not in FEATURE_ORDER]
+            if len(unknown) > 0:
+                raise ValueError('Unknown features: {}'.format(unknown))
+            feature_names = [fn for fn in FEATURE_ORDER
+                             if fn in feature_names]
+
+            overlay = query.get('overlay',
+                                '1' if endpoint == 'segment' else '0')
+            options = dict(self.server.options,
+                           feature_names=feature_names,
+                           overlay=float(query['alpha'])
+                           if 'alpha' in query else
+                           (None if overlay == '1' else False))
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': '{:s}: {}'.format(type(e).__name__,
+                                                         e)})
+            return
+
+        try:
+            result = self.server.batcher.submit(
+                (source, options), endpoint == 'classify').result()
+        except (ValueError, FileNotFoundError) as e:
+            # The image could not be read.
+            self._reply(400, {'error': '{:s}: {}'.format(type(e).__name__,
+                                                         e)})
+            return
+        except Exception as e:
+            self._reply(500, {'error': '{:s}: {}'.format(type(e).__name__,
+                                                         e)})
+            return
+
+        response = {'phase_fractions': dict(zip(
+            ['matrix', 'p2', 'p3'], [_json_number(x)
+                                     for x in result['fractions']]))}
+        if result['features'] is not None:
+            columns = feature_columns(feature_names, options['P'])
+            response['features'] = dict(zip(
+                columns, [_json_number(x) for x in result['features']]))
+        if result['proba'] is not None:
+            proba = result['proba']
+            response['prediction'] = classifier.labels[int(np.argmax(proba))]
+            response['probabilities'] = dict(zip(
+                classifier.labels, [float(p) for p in proba]))
+        if result['overlay'] is not None:
+            response['overlay'] = base64.b64encode(
+                result['overlay']).decode('ascii')
+        times = result['times']
+        times['total'] = time.time() - start
+        response['latency_ms'] = {k: round(v * 1000, 2)
+                                  for k, v in times.items()}
+        response['batch_size'] = result['batch_size']
+        self._reply(200, response)
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """HTTP server answering every request in its own thread."""
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Local segmentation and classification server.')
+    parser.add_argument('--model', type=str, default=None,
+                        help='model saved by train.py, for /classify')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes; 0 uses all cores')
+    parser.add_argument('--batch-size', type=int, default=8,
+                        help='largest number of requests in a batch')
+    parser.add_argument('--batch-wait', type=float, default=10,
+                        help='milliseconds a request waits for others to '
+                             'join its batch')
+    parser.add_argument('--root', type=str, action='append', default=None,
+                        help='directory whose images may be requested by '
+                             'path; can be repeated. Without it, paths are '
+                             'only accepted when HOST is a loopback address')
+    parser.add_argument('--verbose', action='store_true',
+                        help='log every request')
+    parser.add_argument('--no-info-bar', action='store_true',
+                        help='the images have no info bar to crop')
+    # Feature parameters; with a model, they should be those of the
+    # training table.
+    parser.add_argument('--d', type=int, default=15)
+    parser.add_argument('--sigma-color', type=float, default=75)
+    parser.add_argument('--sigma-space', type=float, default=75)
+    parser.add_argument('--clustering', type=str, default='histogram')
+    parser.add_argument('--denoise', type=str, default='bilateral')
+    parser.add_argument('--level', type=int, default=0)
+    parser.add_argument('--ksize0', type=int, default=9)
+    parser.add_argument('--ksize1', type=int, default=9)
+    parser.add_argument('--ksize2', type=int, default=9)
+    parser.add_argument('--ksize3', type=int, default=3)
+    parser.add_argument('--distance', type=int, default=1)
+    parser.add_argument('--P', type=int, default=10)
+    parser.add_argument('--R', type=float, default=5)
+    args = parser.parse_args()
+
+    classifier = None
+    if args.model is not None:
+        from predict import Classifier
+        classifier = Classifier(args.model)
+        print('Loaded {:s} model {:s}.'.format(classifier.mode, args.model))
+
+    n_workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    executor = ProcessPoolExecutor(max_workers=n_workers)
+    # Start and warm up every worker before taking requests.
+    list(executor.map(_warm_up, range(n_workers)))
+
+    server = Server((args.host, args.port), RequestHandler)
+    server.verbose = args.verbose
+    server.n_workers = n_workers
+    server.classifier = classifier
+    if args.root is not None:
+        server.roots = [os.path.realpath(r) for r in args.root]
+    elif is_loopback(args.host):
+        server.roots = None
+    else:
+        # Only uploads.
+        server.roots = []
+    server.batcher = Batcher(executor, classifier, args.batch_size,
+                             args.batch_wait / 1000)
+    server.options = {
+        'with_info_bar': not args.no_info_bar,
+        'params': {'d': args.d, 'sigma_color': args.sigma_color,
+                   'sigma_space': args.sigma_space,
+                   'clustering': args.clustering, 'denoise': args.denoise,
+                   'level': args.level,
+                   'ksize0': args.ksize0, 'ksize1': args.ksize1,
+                   'ksize2': args.ksize2, 'ksize3': args.ksize3},
+        'distance': args.distance,
+        'P': classifier.P if classifier is not None else args.P,
+        'R': args.R}
+    print('Serving on http://{:s}:{:d} with {:d} workers.'.format(
+        args.host, args.port, n_workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+        executor.shutdown()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : test_cache.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import numpy as np
+
+from features.cache import FeatureCache, RESCAN_FRACTION
+
+
+def test_shared_directory_stays_bounded(tmp_path):
+    # One cache object per worker process, as pickled to the workers.
+    n_workers = 4
+    max_size = 100000
+    caches = [FeatureCache(str(tmp_path), max_size)
+              for _ in range(n_workers)]
+    value = np.arange(13, dtype=np.float64)
+    for i in range(1500):
+        caches[i % n_workers].put('{:040x}'.format(i), value)
+    entries = caches[0].entries()
+    entry_size = entries[0][2]
+    total = sum(e[2] for e in entries)
+    assert total <= max_size * (1 + n_workers * RESCAN_FRACTION) + \
+        n_workers * entry_size
+    # The most recently written entries are kept.
+    assert caches[0].get('{:040x}'.format(1499)) is not None
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : test_imagesource.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from features.imagesource import crop_rows, crop_image, read_image
+
+GUI_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'gui')
+
+
+def microstructure(shape, seed=0):
+    """Grayscale image with dark, medium and bright regions."""
+    rng = np.random.RandomState(seed)
+    noise = cv2.GaussianBlur(rng.rand(*shape), (0, 0), 6)
+    noise = (noise - noise.min()) / (noise.max() - noise.min())
+    img = np.where(noise < 0.35, 40, np.where(noise < 0.7, 130, 220))
+    return np.clip(img + rng.randint(-10, 10, shape), 0, 255).astype(np.uint8)
+
+
+def test_crop_rows_known_sizes():
+    assert crop_rows((2048, 2560)) == 1920
+    assert crop_rows((1024, 1280, 3)) == 960
+
+
+def test_unlisted_size_is_kept_whole(tmp_path):
+    img = microstructure((300, 400))
+    filename = str(tmp_path / 'odd.png')
+    cv2.imwrite(filename, img)
+    assert crop_rows(img.shape) == 300
+    assert crop_image(img).shape == (300, 400)
+    assert np.array_equal(read_image(filename, crop_rows), img)
+
+
+def test_gui_features_of_unlisted_size(tmp_path):
+    pytest.importorskip('mahotas')
+    sys.path.insert(0, GUI_DIR)
+    try:
+        import imageFeatures
+    finally:
+        sys.path.remove(GUI_DIR)
+    filename = str(tmp_path / 'odd.png')
+    cv2.imwrite(filename, microstructure((300, 400)))
+    f = imageFeatures.collect_features_from_file(filename, True, True, True,
+                                                 True)
+    assert f.shape == (1, 3 + 14 + 13 + 12)
+    assert np.isclose(f[0, :3].sum(), 1)
+
+
+@pytest.mark.parametrize('shape', [(300, 400), (1024, 1280)])
+def test_tiled_and_whole_images_are_cropped_alike(tmp_path, shape):
+    from features.features import image_features
+    filename = str(tmp_path / 'img.png')
+    cv2.imwrite(filename, microstructure(shape))
+    feature_names = ['area', 'spatial', 'haralick', 'lbp']
+    whole = image_features(filename, feature_names)
+    tiled = image_features(filename, feature_names, tile_size=128)
+    assert np.allclose(whole, tiled)
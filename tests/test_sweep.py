@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Filename : test_sweep.py
+# @Date : 2026-10-18
+# @Author : Wufei Ma
+
+import cv2
+import numpy as np
+import pytest
+
+from features import collect_features_by_filenames
+from features.sweep import parameter_grid, sweep_features
+
+FEATURE_NAMES = ['area', 'spatial', 'haralick', 'lbp']
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('value', [0, 128])
+def test_constant_image_matches_collect(tmp_path, value):
+    filename = str(tmp_path / 'constant.png')
+    cv2.imwrite(filename, np.full((300, 400), value, np.uint8))
+    settings = parameter_grid({'P': [8, 10], 'R': [3, 5]})
+    features = sweep_features([filename], settings, FEATURE_NAMES)
+    for s, f in zip(settings, features):
+        expected = collect_features_by_filenames([filename], FEATURE_NAMES,
+                                                 **s)
+        np.testing.assert_array_equal(f, expected)
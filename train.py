@@ -6,26 +6,41 @@
 
 import os
 import sys
+import time
 from joblib import dump, load
 import collections
 
 import cv2
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from models import *
 from utils import *
+from features.store import load_feature_table
+from predict import write_model_info
 
 classes = ['DUM1178', 'DUM1154', 'DUM1297', 'DUM1144', 'DUM1150',
            'DUM1160', 'DUM1180', 'DUM1303', 'DUM1142', 'DUM1148']
 column1 = ['DUM1178', 'DUM1154', 'DUM1297', 'DUM1144', 'DUM1150', 'DUM1160']
 column2 = ['DUM1180', 'DUM1303', 'DUM1142', 'DUM1148']
 
+# A .csv, .npz, .feather or .parquet feature table; binary tables load much
+# faster, see features/store.py to convert one.
 features_file = 'features_feb02.csv'
 
 
-def train(mode, feature_names, output_dir, model_dir, output_prefix, logger):
+def train(mode, feature_names, output_dir, model_dir, output_prefix, logger,
+          diagnostics=False, evaluation='cv', target_accuracy=None):
+    """Evaluate a random forest on Task a (mode='10-class') or Task b
+    (mode='binary') and save it to model_dir.
+
+    evaluation='cv' runs 5-fold cross-validation and saves the model of the
+    last fold. evaluation='oob' fits one forest on all the data and reports
+    its out-of-bag scores, which costs about a fifth as much, and
+    evaluation='sweep' grows the forest through models.TREE_COUNTS trees
+    until the OOB accuracy reaches target_accuracy. Both save a model
+    trained on all the data.
+    """
     if not os.path.isdir(output_dir):
         os.mkdir(output_dir)
     if not os.path.isdir(model_dir):
@@ -38,8 +53,9 @@ def train(mode, feature_names, output_dir, model_dir, output_prefix, logger):
     logger.log('\tTrained model saved to: {:s}'.format(model_dir))
     logger.log('\tOutput prefix: {:s}'.format(output_prefix))
     logger.log('\tFeatures used: {:s}'.format(str(feature_names)))
+    logger.log('\tEvaluation: {:s}'.format(evaluation))
 
-    df = pd.read_csv(features_file, index_col=0)
+    df = load_feature_table(features_file, columns=feature_names + ['met_id'])
     X = df[feature_names].to_numpy()
     if mode == '10-class':
         Y = np.array([classes.index(x) for x in df['met_id'].to_numpy()])
@@ -50,47 +66,73 @@ def train(mode, feature_names, output_dir, model_dir, output_prefix, logger):
         ])
     else:
         raise ValueError('Unsupported training mode: {:s}'.format(mode))
-    model = train_random_forest(X, Y, logger)  # the 5th model
+    if evaluation == 'cv':
+        model = train_random_forest(X, Y, logger, diagnostics)  # the 5th model
+    elif evaluation == 'oob':
+        model = train_random_forest_oob(X, Y, logger)
+    elif evaluation == 'sweep':
+        model, _ = tree_count_sweep(X, Y, logger,
+                                    target_accuracy=target_accuracy)
+    else:
+        raise ValueError('Unsupported evaluation: {:s}'.format(evaluation))
     model_name = os.path.join(model_dir, output_prefix+'_trained_rf_model_for_{:s}.joblib'.format(mode))
     dump(model, model_name)
+    write_model_info(model_name, mode, feature_names)
 
     logger.log('-' * 32 + '\n')
 
 
-def binary_classification(df, met_ids):
+def pair_data(df, met_ids):
+    """Area features and labels (True for met_ids[1]) of the images of two
+    classes, or None if one of them has no images."""
     df = df.loc[df['met_id'].isin(met_ids)]
     f = df[['area_0', 'area_1', 'area_2']].to_numpy()
     l = df['met_id'].to_numpy()
     l = l == met_ids[1]
     if np.sum(l == 0) == 0 or np.sum(l == 1) == 0:
+        return None
+    return f[:, :2], l
+
+
+def binary_classification(df, met_ids):
+    data = pair_data(df, met_ids)
+    if data is None:
         return np.nan, np.nan
-    return train_random_forest_f1_mcc(f[:, :2], l)
+    return train_random_forest_f1_mcc(*data)
 
 
-def train_binary_classification(output_dir, output_prefix, logger):
+def train_binary_classification(output_dir, output_prefix, logger, n_jobs=-1,
+                                random_state=None):
+    """Experiment 4: F1 and MCC of every pair of classes. The 5 folds of all
+    45 pairs are fitted as one pool of n_jobs workers, see
+    models.cross_validate_f1_mcc."""
     logger.log('\n' + '-' * 32)
     logger.log('Running Experiment 4...')
     logger.log('\tOutput saved to: {:s}'.format(output_dir))
     logger.log('\tOutput prefix: {:s}'.format(output_prefix))
 
-    df = pd.read_csv(features_file, index_col=0)
-
-    f1_scores = np.zeros((len(classes), len(classes)))
-    mcc_scores = np.zeros((len(classes), len(classes)))
-    for i in range(len(classes)):
-        for j in range(len(classes)):
-            if i > j:
-                continue
-            elif i == j:
-                f1_scores[i, j] = np.nan
-                mcc_scores[i, j] = np.nan
-                f1_scores[j, i] = np.nan
-                mcc_scores[j, i] = np.nan
-            else:
-                f1_scores[i, j], mcc_scores[i, j] = binary_classification(df, [classes[i], classes[j]])
-                f1_scores[j, i], mcc_scores[j, i] = f1_scores[i, j], mcc_scores[i, j]
-                print('For class {:s} and {:s}: F1 score: {:.3f}; MCC score: {:.3f}.'
-                      .format(classes[i], classes[j], f1_scores[i, j], mcc_scores[i, j]))
+    df = load_feature_table(features_file,
+                            columns=['met_id', 'area_0', 'area_1', 'area_2'])
+
+    pairs = [(i, j) for i in range(len(classes))
+             for j in range(i + 1, len(classes))]
+    data = [pair_data(df, [classes[i], classes[j]]) for i, j in pairs]
+    start = time.time()
+    scores = cross_validate_f1_mcc([d for d in data if d is not None],
+                                   n_jobs=n_jobs, random_state=random_state,
+                                   logger=logger)
+    scores = iter(scores)
+
+    f1_scores = np.full((len(classes), len(classes)), np.nan)
+    mcc_scores = np.full((len(classes), len(classes)), np.nan)
+    for (i, j), d in zip(pairs, data):
+        if d is not None:
+            f1_scores[i, j], mcc_scores[i, j] = next(scores)
+        f1_scores[j, i], mcc_scores[j, i] = f1_scores[i, j], mcc_scores[i, j]
+        print('For class {:s} and {:s}: F1 score: {:.3f}; MCC score: {:.3f}.'
+              .format(classes[i], classes[j], f1_scores[i, j], mcc_scores[i, j]))
+    logger.log('\t{:d} pairs trained in {:s}'.format(
+        len(pairs), format_time(time.time() - start)))
 
     f1_results = pd.DataFrame(f1_scores)
     mcc_results = pd.DataFrame(mcc_scores)
@@ -128,6 +170,19 @@ if __name__ == '__main__':
     model_dir = 'train_models'
     output_prefix = 'results_may03'
 
+    # Number of processes for the folds of Experiment 4, -1 for all cores
+    n_jobs = -1
+
+    # Also log tree sizes and training set scores of Task a and Task b
+    diagnostics = False
+
+    # Evaluation of Task a and Task b: 'cv' for 5-fold cross-validation as
+    # in the paper, 'oob' for the out-of-bag scores of one forest trained on
+    # all the data, or 'sweep' to grow that forest until its OOB accuracy
+    # reaches target_accuracy (None tries every count in TREE_COUNTS)
+    evaluation = 'cv'
+    target_accuracy = None
+
     # Step 3/3:
     # Comment/uncomment the following lines to choose experiments
     # Task a:        10-class classification to predict microstructure
@@ -155,7 +210,10 @@ if __name__ == '__main__':
               output_dir=output_dir,
               model_dir=model_dir,
               output_prefix=output_prefix,
-              logger=logger)
+              logger=logger,
+              diagnostics=diagnostics,
+              evaluation=evaluation,
+              target_accuracy=target_accuracy)
 
     # Task b
     if 'Task-b' in experiment_list:
@@ -164,13 +222,17 @@ if __name__ == '__main__':
               output_dir=output_dir,
               model_dir=model_dir,
               output_prefix=output_prefix,
-              logger=logger)
+              logger=logger,
+              diagnostics=diagnostics,
+              evaluation=evaluation,
+              target_accuracy=target_accuracy)
 
     # Experiment 4
     if 'Experiment-4' in experiment_list:
         train_binary_classification(output_dir=output_dir,
                                     output_prefix=output_prefix,
-                                    logger=logger)
+                                    logger=logger,
+                                    n_jobs=n_jobs)
 
     # Save to log file
     logger.flush()
@@ -10,12 +10,9 @@ import itertools
 
 import cv2
 import numpy as np
-import pandas as pd
-
-from matplotlib import pyplot as plt
-plt.rcParams['axes.grid'] = False
 
 import features
+from features.imagesource import crop_rows, crop_image
 
 COLORS = [(219, 94, 86),
           (86, 219, 127),
@@ -51,29 +48,42 @@ def format_time(time):
                                           (time % 3600) // 60, time % 60)
 
 
-def crop_image(image):
-    if image.shape[0] == 2048 and image.shape[1] == 2560:
-        return image[:1920, :]
-    elif image.shape[0] == 1428 and image.shape[1] == 2048:
-        return image[:1408, :]
-    elif image.shape[0] == 1024 and image.shape[1] == 1280:
-        return image[:960, :]
-    elif image.shape[0] == 1448 and image.shape[1] == 2048:
-        return image[:1428, :]
-    else:
-        raise Exception("Unknown image size: {}".format(image.shape))
-
-
 def segment_image(img, d=15, sigma_color=75, sigma_space=75,
-                  with_info_bar=True):
+                  with_info_bar=True, clustering='histogram',
+                  denoise='bilateral', level=0, ksize0=9, ksize1=9,
+                  ksize2=9, ksize3=3):
     if len(img.shape) > 2 and img.shape[2] != 1:
         raise ValueError('The input image should be in grayscale')
     _, seg_img = features.segmentation(img, d, sigma_color, sigma_space,
                                        with_info_bar=with_info_bar,
-                                       visualization=True)
+                                       visualization=True,
+                                       clustering=clustering,
+                                       denoise=denoise, level=level,
+                                       ksize0=ksize0, ksize1=ksize1,
+                                       ksize2=ksize2, ksize3=ksize3)
     return seg_img
 
 
+def set_plot_style():
+    """Plain axes without spines, ticks or grid for the plots below.
+    Matplotlib and Seaborn are only imported here, so that the rest of this
+    module and features can be used without them."""
+    import seaborn as sns
+    from matplotlib import pyplot as plt
+    rc = {"axes.spines.left" : False,
+          "axes.spines.right" : False,
+          "axes.spines.bottom" : False,
+          "axes.spines.top" : False,
+          "xtick.bottom" : False,
+          "xtick.labelbottom" : False,
+          "ytick.labelleft" : False,
+          "ytick.left" : False}
+    plt.rcParams.update(rc)
+    sns.set_style('whitegrid', {'axes.grid': False})
+    plt.rcParams['axes.grid'] = False
+    return plt
+
+
 def plot_confusion_matrix(confusion_matrix_file, clim, plot_title=None,
                           plot_filename=None, xlabel=None, ylabel=None):
     if plot_filename is None:
@@ -86,6 +96,9 @@ def plot_confusion_matrix(confusion_matrix_file, clim, plot_title=None,
     xlabel = 'Ground truth' if xlabel is None else xlabel
     ylabel = 'Predicted' if ylabel is None else ylabel
 
+    import pandas as pd
+    plt = set_plot_style()
+
     print('Plotting confusion matrix from {:s}...'.format(confusion_matrix_file))
     mat = pd.read_csv(confusion_matrix_file, index_col=0)
     mat = mat.to_numpy()